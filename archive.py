@@ -0,0 +1,73 @@
+import csv
+import gzip
+import hashlib
+import os
+import threading
+
+
+INDEX_FIELDS = ['state', 'time', 'url', 'hash', 'encoding']
+
+
+# Raw source archive. Every body is stored once as blobs/<hash[:2]>/<hash>.gz
+# and index.csv maps (state, fetch time, url) to the blob. A row is only
+# appended when the body of a url differs from the last one archived for that
+# state, so polling an unchanged page does not grow the archive.
+class Archive:
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.join(path, 'index.csv')
+        self.lock = threading.Lock()
+        self.last_hashes = {}
+
+        for entry in self.entries():
+            self.last_hashes[(entry['state'], entry['url'])] = entry['hash']
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, 'blobs', digest[:2], '{}.gz'.format(digest))
+
+    def add(self, state_short, time, url, content, encoding):
+        digest = hashlib.sha256(content).hexdigest()
+
+        with self.lock:
+            if self.last_hashes.get((state_short, url)) == digest:
+                return digest
+
+            blob_path = self._blob_path(digest)
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+                tmp_path = '{}.tmp'.format(blob_path)
+                with gzip.open(tmp_path, 'wb') as file:
+                    file.write(content)
+                os.replace(tmp_path, blob_path)
+
+            new_index = not os.path.exists(self.index_path)
+            with open(self.index_path, 'a', encoding='utf-8', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=INDEX_FIELDS)
+                if new_index:
+                    writer.writeheader()
+
+                writer.writerow({
+                    'state': state_short,
+                    'time': time,
+                    'url': url,
+                    'hash': digest,
+                    'encoding': encoding or ''
+                })
+
+            self.last_hashes[(state_short, url)] = digest
+
+        return digest
+
+    def read(self, digest):
+        with gzip.open(self._blob_path(digest), 'rb') as file:
+            return file.read()
+
+    def entries(self, state_short=None):
+        try:
+            with open(self.index_path, encoding='utf-8', newline='') as file:
+                for entry in csv.DictReader(file):
+                    if state_short is None or entry['state'] == state_short:
+                        yield entry
+        except FileNotFoundError:
+            return
@@ -1,14 +1,14 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import os
-import requests
+import common
+import counties
+import dates
+import re
 import sys
-import traceback
-from datetime import datetime
+from common import FetchError
 from lxml import html
+from observations import Batch
+from table import Column, Table
 
 
 DEBUG = False
@@ -16,202 +16,108 @@ DEBUG = False
 STATE = 'Brandenburg'
 STATE_SHORT = 'BB'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
+XPATHS = common.compile_xpaths({
+    'rows': '//table/tbody/tr',
+    'cells': 'td',
+    'cell_strong_text': 'p/strong/text()',
+    'cell_text': 'p/text()',
+    'posts': '//form[@action="filterform"]/div[@class="trennung medium-12 "]/div[@class="bb-teaser-item"]',
+    'post_title': 'h2/a/text()',
+    'post_href': 'h2/a/@href'
+})
+
+TABLE = Table(
+    cells=XPATHS['cells'],
+    county=Column(0, text=XPATHS['cell_strong_text']),
+    infected=Column(2, text=XPATHS['cell_text'], empty=('---',)),
+    death=Column(-1, text=XPATHS['cell_text'], empty=('',)),
+    skip=re.compile('Brandenburg gesamt$')
+)
+
+# The data article is recognized by the date in its table header, without
+# parsing it (see common.fetch_article()).
+ARTICLE_DATE = re.compile(r'<strong>\s*Stand:\s*(\d{1,2})\.\s*(\d{1,2})\.')
 
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
 
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+def notify(msg):
+    common.notify(STATE_SHORT, msg)
 
 
-def notify(msg):
-    print(msg)
+class CoronaParser:
+    def __init__(self, html_text):
+        self.tree = html.fromstring(html_text)
 
-    if 'pushover' not in CONFIG:
-        return
+    def _normalize_county(self, county):
+        return counties.resolve(STATE, county)
 
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    def parse(self):
+        table = XPATHS['rows'](self.tree)
 
+        dt_text = XPATHS['cell_strong_text'](XPATHS['cells'](table[0])[2])[-1].replace(' ', '')
+        dt = dates.strptime(dt_text, 'Stand:%d.%m.,%H:%MUhr').replace(year=2020).strftime('%Y-%m-%dT%H:%M:%SZ')
 
-class CoronaParser:
-    def __init__(self, db, html_text):
-        self.db = db
-        self.tree = html.fromstring(html_text)
+        # Counties
+        data = Batch(STATE, STATE_SHORT, dt)
+        for row in TABLE.extract(table[1:]):
+            data.add(self._normalize_county(row.county), row.infected, row.death)
 
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
+        return dt, data
 
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
 
-    def _normalize_county(self, county):
-        county = county.replace('Brandenburg a. d. H.', 'Brandenburg an der Havel')
-        county = county.replace('Brandenburg a. d. Havel', 'Brandenburg an der Havel')
+SEARCH_URL = 'https://msgiv.brandenburg.de/msgiv/de/presse/pressemitteilungen/'
+
+
+def search(fetcher):
+    r = fetcher.get(SEARCH_URL, fingerprint=False)
+    if not r.ok:
+        raise FetchError('ERROR: failed to search overview, status code: {}'.format(r.status_code))
 
-        return county
+    tree = html.fromstring(r.text)
+    urls = []
+    posts = XPATHS['posts'](tree)
+    for post in posts:
+        title = XPATHS['post_title'](post)[0]
+        href = XPATHS['post_href'](post)[0]
+
+        if 'Erkrankungen an COVID-19' in title or 'COVID-19-Erkrankungen' in title or 'COVID-19-Fälle' in title:
+            urls.append('https://msgiv.brandenburg.de{}'.format(href))
 
-    def _calculate_per_population(self, county, infected, per_population):
-        try:
-            if county in POPULATION['city'][STATE_SHORT]:
-                population = POPULATION['city'][STATE_SHORT][county]
-            else:
-                population = POPULATION['county'][STATE_SHORT][county]
+    if not urls:
+        raise FetchError('ERROR: no matching post found')
 
-            return round(infected * per_population / population, 2)
-        except:
-            notify('{} not found in population database.'.format(county))
+    return urls
 
+
+# Returns the day of the data (as in dt) or None if the page is no data
+# article.
+def article_date(html_text):
+    match = ARTICLE_DATE.search(html_text)
+    if not match:
         return None
 
-    def _calculate_p10k(self, county, infected):
-        return self._calculate_per_population(county, infected, 10000)
+    return '2020-{:02d}-{:02d}'.format(int(match.group(2)), int(match.group(1)))
 
-    def _calculate_p100k(self, county, infected):
-        return self._calculate_per_population(county, infected, 100000)
 
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
+def fetch(fetcher, data_url=None):
+    if not data_url:
+        return common.fetch_article(fetcher, search, article_date)
 
-        return round(infected * per_population / population, 2)
+    r = fetcher.get(data_url)
+    if not r.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
 
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
+    return r.text
 
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
 
-    def parse(self):
-        table = self.tree.xpath('//table/tbody/tr')
+def parse(html_text):
+    corona_parser = CoronaParser(html_text)
 
-        dt_text = table[0].xpath('td')[2].xpath('p/strong/text()')[-1].replace(' ', '')
-        dt = datetime.strptime(dt_text, 'Stand:%d.%m.,%H:%MUhr').replace(year=2020).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return corona_parser.parse()
 
-        # Counties
-        data = []
-        infected_sum = 0
-        death_sum = 0
-        for row in table[1:]:
-            cells = row.xpath('td')
-
-            if not cells:
-                continue
-
-            if cells[0].xpath('p/strong')[0].text.strip() == 'Brandenburg gesamt':
-                continue
-
-            county = self._normalize_county(cells[0].xpath('p/strong')[0].text.replace('*', '').strip())
-            infected_str = cells[2].xpath('p')[0].text.replace('*', '').strip()
-            death_str = cells[-1].xpath('p')[0].text.replace('*', '').strip()
-
-            if infected_str == '---':
-                infected = 0
-            else:
-                infected = int(infected_str)
-                infected_sum += infected
-
-            if death_str:
-                death = int(death_str)
-                death_sum += death
-            else:
-                death = 0
-
-            data.append({
-                'measurement': 'infected_de_state',
-                'tags': {
-                    'state': STATE,
-                    'county': county
-                },
-                'time': dt,
-                'fields': {
-                    'count': infected,
-                    'p10k': self._calculate_p10k(county, infected),
-                    'p100k': self._calculate_p100k(county, infected),
-                    'death': death
-                }
-            })
-
-        data.append({
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum),
-                'death': death_sum
-            }
-        })
-
-        self._store(data)
-
-        return dt
-
-
-search_url = 'https://msgiv.brandenburg.de/msgiv/de/presse/pressemitteilungen/'
-
-if len(sys.argv) == 2:
-    data_url = sys.argv[1]
-else:
-    r = requests.get(search_url, headers={'User-Agent': CONFIG['user_agent']})
-    if not r.ok:
-        print('ERROR: failed to search overview, status code: {}'.format(r.stats_code))
-        sys.exit(1)
 
-    tree = html.fromstring(r.text)
-    posts = tree.xpath('//form[@action="filterform"]/div[@class="trennung medium-12 "]/div[@class="bb-teaser-item"]')
-    data_url = None
-    for post in posts:
-        title = post.xpath('h2/a/text()')[0]
-        href = post.xpath('h2/a/@href')[0]
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
 
-        if 'Erkrankungen an COVID-19' in title or 'COVID-19-Erkrankungen' in title or 'COVID-19-Fälle' in title:
-            data_url = 'https://msgiv.brandenburg.de{}'.format(href)
-            break
-
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to search overview, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, r.text)
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
@@ -1,15 +1,12 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import os
-import re
-import requests
+import common
+import dates
 import sys
-import traceback
-from datetime import datetime
+from common import FetchError
 from lxml import html
+from observations import Batch
+from phrases import Phrases
 
 
 DEBUG = False
@@ -17,122 +14,66 @@ DEBUG = False
 STATE = 'Berlin'
 STATE_SHORT = 'BE'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
+XPATHS = common.compile_xpaths({
+    'posts': '//ul[@class="list-autoteaser"]/li',
+    'post_title': 'div[@class="span10 cell text"]/a/text()',
+    'post_date': 'div[@class="span2 cell date"]/text()'
+})
 
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
-
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+# Read from the titles of the press releases, the first title with a case
+# count is the newest report. The titles give no total of deaths, only new
+# ones, so no deaths are read.
+PHRASES = Phrases({
+    'infected': '{} bestätigte Fälle'
+})
 
 
 def notify(msg):
-    print(msg)
-
-    if 'pushover' not in CONFIG:
-        return
-
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    common.notify(STATE_SHORT, msg)
 
 
 class CoronaParser:
-    def __init__(self, db, html_text):
-        self.db = db
+    def __init__(self, html_text):
         self.tree = html.fromstring(html_text)
 
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
+    def parse(self):
+        posts = XPATHS['posts'](self.tree)
+        titles = (XPATHS['post_title'](post)[0] for post in posts)
 
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
+        index, values = PHRASES.first(titles, ['infected'])
+        infected_sum = values.get('infected')
+        if not infected_sum:
+            raise Exception('ERROR: CoronaParser: No data found')
 
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
+        dt_text = XPATHS['post_date'](posts[index])[0]
+        dt = dates.strptime(dt_text, '%d.%m.%Y %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
 
-        return round(infected * per_population / population, 2)
+        data = Batch(STATE, STATE_SHORT, dt, deaths=False)
+        data.total(infected_sum)
 
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
+        return dt, data
 
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
 
-    def parse(self):
-        dt = None
-        infected_sum = None
+DATA_URL = 'https://www.berlin.de/sen/gpg/service/presse/2020/'
 
-        posts = self.tree.xpath('//ul[@class="list-autoteaser"]/li')
-        for post in posts:
-            title = post.xpath('div[@class="span10 cell text"]/a/text()')[0]
-            results = re.findall(r'([\d\.]+) bestätigte Fälle', title)
-            if results:
-                dt_text = post.xpath('div[@class="span2 cell date"]/text()')[0]
-                dt = datetime.strptime(dt_text, '%d.%m.%Y %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
-                infected_sum = int(results[0].replace('.', ''))
 
-                break
+def fetch(fetcher, data_url=DATA_URL):
+    r = fetcher.get(data_url)
+    if not r.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
+
+    return r.text
+
+
+def parse(html_text):
+    corona_parser = CoronaParser(html_text)
+
+    return corona_parser.parse()
+
+
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
 
-        if not dt or not infected_sum:
-            raise Exception('ERROR: CoronaParser: No data found')
 
-        self._store([{
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum)
-            }
-        }])
-
-        return dt
-
-
-data_url = 'https://www.berlin.de/sen/gpg/service/presse/2020/'
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to search overview, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, r.text)
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
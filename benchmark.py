@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import copy
+import importlib
+import os
+import sys
+import time
+import tracemalloc
+from collect import STATES
+from common import BASE_PATH, RecordedFetcher
+from table import Column
+
+
+FIXTURES_PATH = os.path.join(BASE_PATH, 'fixtures')
+ITERATIONS = 50
+
+
+# Answers the requests of a state's fetch() with the fixture files of that
+# state, in file name order, so the payload is built exactly as in a live run
+# but without touching the network. Requests beyond the fixture files
+# (e.g. further article candidates) get a 404.
+class FixtureFetcher(RecordedFetcher):
+    def __init__(self, state_name):
+        path = os.path.join(FIXTURES_PATH, state_name)
+        self.files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+
+    def get(self, url, fingerprint=True, conditional=True):
+        import requests
+
+        r = requests.models.Response()
+        r.url = url
+
+        try:
+            path = self.files.pop(0)
+        except IndexError:
+            r.status_code = 404
+            r._content = b''
+            return r
+
+        with open(path, 'rb') as file:
+            content = file.read()
+
+        r.status_code = 200
+        r._content = content
+        r.encoding = 'utf-8'
+
+        return r
+
+
+# Evaluates the expression the way the parsers did before XPATHS, compiling it
+# on every call.
+class UncompiledXPath:
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, node):
+        return node.xpath(self.path)
+
+
+def _uncompiled(value):
+    from lxml import etree
+
+    if isinstance(value, etree.XPath):
+        return UncompiledXPath(value.path)
+
+    if isinstance(value, Column):
+        column = copy.copy(value)
+        column.text = _uncompiled(value.text)
+        return column
+
+    if isinstance(value, tuple):
+        return tuple(_uncompiled(item) for item in value)
+
+    return value
+
+
+# A copy of a state's TABLE that evaluates its XPaths (cells, label, column
+# texts, header) as strings. TABLE holds the compiled XPaths it was declared
+# with, so swapping XPATHS alone doesn't reach the row loops.
+def uncompiled_table(table):
+    uncompiled = copy.copy(table)
+    for name, value in vars(table).items():
+        setattr(uncompiled, name, _uncompiled(value))
+
+    return uncompiled
+
+
+def _percentile(timings, percentile):
+    return timings[min(len(timings) - 1, len(timings) * percentile // 100)]
+
+
+def benchmark(state, iterations):
+    payload = state.fetch(FixtureFetcher(state.__name__))
+
+    # Warm-up, also makes sure the fixtures still parse.
+    state.parse(payload)
+
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        state.parse(payload)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    # Measured in a separate run, tracemalloc slows down the parsers.
+    tracemalloc.start()
+    state.parse(payload)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return iterations / sum(timings), _percentile(timings, 50), _percentile(timings, 99), peak
+
+
+def _time_parse(state, payload, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        state.parse(payload)
+
+    return (time.perf_counter() - start) / iterations
+
+
+# Compares parse() with the precompiled XPATHS against the same expressions
+# compiled on every call. The saving is also given per stored data point,
+# which is roughly one table row.
+def benchmark_xpaths(state, iterations):
+    payload = state.fetch(FixtureFetcher(state.__name__))
+    points = len(state.parse(payload)[1])
+
+    compiled = state.XPATHS
+    compiled_table = getattr(state, 'TABLE', None)
+    try:
+        state.XPATHS = {name: UncompiledXPath(xpath.path) for name, xpath in compiled.items()}
+        if compiled_table:
+            state.TABLE = uncompiled_table(compiled_table)
+        uncompiled_time = _time_parse(state, payload, iterations)
+    finally:
+        state.XPATHS = compiled
+        if compiled_table:
+            state.TABLE = compiled_table
+    compiled_time = _time_parse(state, payload, iterations)
+
+    return uncompiled_time, compiled_time, (uncompiled_time - compiled_time) / points
+
+
+def main_xpaths(args, iterations):
+    print('{:<5} {:>14} {:>14} {:>16}'.format('state', 'string ms', 'compiled ms', 'saved us/row'))
+
+    for name in args or STATES:
+        uncompiled_time, compiled_time, saved = benchmark_xpaths(importlib.import_module(name), iterations)
+
+        print('{:<5} {:>14.2f} {:>14.2f} {:>16.2f}'.format(name, uncompiled_time * 1000, compiled_time * 1000, saved * 1000000))
+
+
+def main():
+    args = sys.argv[1:]
+
+    iterations = ITERATIONS
+    if args and args[0] == '-n':
+        iterations = int(args[1])
+        args = args[2:]
+
+    if args and args[0] == 'xpath':
+        main_xpaths(args[1:], iterations)
+        return
+
+    print('{:<5} {:>10} {:>10} {:>10} {:>12}'.format('state', 'ops/s', 'p50 ms', 'p99 ms', 'peak KiB'))
+
+    for name in args or STATES:
+        ops, p50, p99, peak = benchmark(importlib.import_module(name), iterations)
+
+        print('{:<5} {:>10.1f} {:>10.2f} {:>10.2f} {:>12.0f}'.format(name, ops, p50 * 1000, p99 * 1000, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
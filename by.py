@@ -1,14 +1,13 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import os
-import requests
+import common
+import counties
+import dates
+import re
 import sys
-import traceback
-from datetime import datetime
-from lxml import html
+from common import FetchError
+from observations import Batch
+from table import Column, Table
 
 
 DEBUG = False
@@ -16,200 +15,87 @@ DEBUG = False
 STATE = 'Bayern'
 STATE_SHORT = 'BY'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
-
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
-
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+XPATHS = common.compile_xpaths({
+    'date': '//div[@id="content_1c"]/script/text()',
+    'time': '//p[@class="bildunterschrift"]/strong/text()',
+    'counties_table': '//div[@class="row abstand_unten"]//table',
+    'rows': 'tr',
+    'header': 'th/span/text()',
+    'cells': 'td/text()'
+})
+
+FRAGMENTS = [
+    ('<div id="content_1c">', '</script>'),
+    ('<p class="bildunterschrift">', '</p>'),
+    ('<div class="row abstand_unten">', '</table>')
+]
+
+# The number of results parse() needs from each XPath in the fragments,
+# otherwise the full page is parsed. The time is the third caption text.
+FRAGMENT_XPATHS = {
+    'date': 1,
+    'time': 3,
+    'counties_table': 1
+}
+
+TABLE = Table(
+    cells=XPATHS['cells'],
+    length=8,
+    infected=Column(1),
+    death=Column(6, empty=('-',)),
+    header=(XPATHS['header'], 0, 'Landkreis/Stadt'),
+    stop=re.compile('Gesamtergebnis$')
+)
 
 
 def notify(msg):
-    print(msg)
-
-    if 'pushover' not in CONFIG:
-        return
-
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    common.notify(STATE_SHORT, msg)
 
 
 class CoronaParser:
-    def __init__(self, db, tree):
-        self.db = db
+    def __init__(self, tree):
         self.tree = tree
 
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
+    def _normalize_county(self, county):
+        return counties.resolve(STATE, county)
 
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
+    def parse(self):
+        d_text = XPATHS['date'](self.tree)[0].split('= "')[1][:-1]
+        t_text = XPATHS['time'](self.tree)[2]
+        dt = dates.strptime(d_text + t_text, '%d.%m.%Y, %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
 
-    def _normalize_county(self, county):
-        county = county.replace('Bad Tölz', 'Bad Tölz-Wolfratshausen')
-        county = county.replace('Dillingen a.d. Donau', 'Dillingen an der Donau')
-        county = county.replace('Mühldorf a.Inn', 'Mühldorf am Inn')
-        county = county.replace('Neumarkt i.d.Opf.', 'Neumarkt in der Oberpfalz')
-        county = county.replace('Neustadt a.d. Aisch-Bad Windsheim', 'Neustadt an der Aisch-Bad Windsheim')
-        county = county.replace('Neustadt a.d. Waldnaab', 'Neustadt an der Waldnaab')
-        county = county.replace('Pfaffenhofen a.d.Ilm', 'Pfaffenhofen an der Ilm')
-        county = county.replace('Wunsiedel i.Fichtelgebirge', 'Wunsiedel im Fichtelgebirge')
+        counties_table = XPATHS['counties_table'](self.tree)[0]
 
-        county = county.replace(' Stadt', ' (Stadt)')
-        county = county.replace('Kempten', 'Kempten (Allgäu)')
-        county = county.replace('Weiden', 'Weiden in der Oberpfalz')
+        rows = XPATHS['rows'](counties_table)
 
-        return county
+        TABLE.check_header(rows[0])
 
-    def _calculate_per_population(self, county, infected, per_population):
-        try:
-            if county.endswith('(Stadt)'):
-                raw_county = county.replace(' (Stadt)', '')
-                population = POPULATION['city'][STATE_SHORT][raw_county]
-            else:
-                population = POPULATION['county'][STATE_SHORT][county]
+        # Counties
+        data = Batch(STATE, STATE_SHORT, dt)
+        for row in TABLE.extract(rows):
+            data.add(self._normalize_county(row.county), row.infected, row.death)
 
-            return round(infected * per_population / population, 2)
-        except:
-            notify('{} not found in population database.'.format(county))
+        return dt, data
 
-        return None
 
-    def _calculate_p10k(self, county, infected):
-        return self._calculate_per_population(county, infected, 10000)
+DATA_URL = 'https://www.lgl.bayern.de/gesundheit/infektionsschutz/infektionskrankheiten_a_z/coronavirus/karte_coronavirus/index.htm'
 
-    def _calculate_p100k(self, county, infected):
-        return self._calculate_per_population(county, infected, 100000)
 
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
+def fetch(fetcher, data_url=DATA_URL):
+    r = fetcher.get(data_url)
+    if not r.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
 
-        return round(infected * per_population / population, 2)
+    return r.text
 
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
 
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
+def parse(html_text):
+    return common.parse_html(sys.modules[__name__], html_text, lambda tree: CoronaParser(tree).parse())
 
-    def parse(self):
-        d_text = self.tree.xpath('//div[@id="content_1c"]/script/text()')[0].split('= "')[1][:-1]
-        t_text = self.tree.xpath('//p[@class="bildunterschrift"]/strong/text()')[2]
-        dt = datetime.strptime(d_text + t_text, '%d.%m.%Y, %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
 
-        counties_table = self.tree.xpath('//div[@class="row abstand_unten"]//table')[0]
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
 
-        if counties_table.xpath('tr')[0].xpath('th/span/text()')[0] != 'Landkreis/Stadt':
-            raise Exception('ERROR: Landkreis table not found')
 
-        # Counties
-        data = []
-        infected_sum = 0
-        death_sum = 0
-        for row in counties_table.xpath('tr'):
-            cells = row.xpath('td/text()')
-
-            if not cells:
-                continue
-
-            if len(cells) != 8:
-                raise Exception('ERROR: invalid cells length: {}'.format(len(cells)))
-
-            if cells[0] == 'Gesamtergebnis':
-                break
-
-            county = self._normalize_county(cells[0].strip())
-            infected_str = cells[1].replace('.', '').strip()
-            death_str = cells[6].replace('.', '').strip()
-
-            infected = int(infected_str)
-            infected_sum += infected
-
-            if death_str == '-':
-                death = 0
-            else:
-                death = int(death_str)
-                death_sum += death
-
-            data.append({
-                'measurement': 'infected_de_state',
-                'tags': {
-                    'state': STATE,
-                    'county': county
-                },
-                'time': dt,
-                'fields': {
-                    'count': infected,
-                    'p10k': self._calculate_p10k(county, infected),
-                    'p100k': self._calculate_p100k(county, infected),
-                    'death': death
-                }
-            })
-
-        data.append({
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum),
-                'death': death_sum
-            }
-        })
-
-        self._store(data)
-
-        return dt
-
-
-data_url = 'https://www.lgl.bayern.de/gesundheit/infektionsschutz/infektionskrankheiten_a_z/coronavirus/karte_coronavirus/index.htm'
-if len(sys.argv) == 2:
-    data_url = sys.argv[1]
-
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to fetch data, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, html.fromstring(r.text))
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
@@ -5,12 +5,13 @@ import influxdb
 import json
 import os
 import sys
+from common import population
 
 BASE_PATH = os.path.dirname(os.path.realpath(__file__))
 CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
 STATES_CSV_PATH = os.path.join(BASE_PATH, 'states.csv')
 
-POPULATION = {}
+STATE_SHORTS = {}
 
 with open(CONFIG_PATH) as file:
     CONFIG = json.load(file)
@@ -18,10 +19,7 @@ with open(CONFIG_PATH) as file:
 with open(STATES_CSV_PATH, encoding='utf-8') as file:
     dict_reader = csv.DictReader(file)
     for row in dict_reader:
-        state = row['state']
-        population = int(row['population'])
-
-        POPULATION[state] = population
+        STATE_SHORTS[row['state']] = row['short']
 
 db = influxdb.InfluxDBClient(
     host=CONFIG['db']['host'],
@@ -32,12 +30,14 @@ db = influxdb.InfluxDBClient(
 db.switch_database(CONFIG['db']['database'])
 
 
-def calculate_p100k( state, infected):
-    population = POPULATION[state]
+# Uses the population table valid at the point's time, so re-running this
+# after adding a newer table does not rewrite older points.
+def calculate_p100k(state, infected, time):
+    state_population = population().state(STATE_SHORTS[state], time)
 
-    return round(infected * 100000 / population, 2)
+    return round(infected * 100000 / state_population, 2)
 
-result = db.query('SELECT * FROM "infected_de" WHERE time >= {}'.format(sys.argv(1))).items()[0][1]
+result = db.query('SELECT * FROM "infected_de" WHERE time >= {}'.format(sys.argv[1])).items()[0][1]
 rows = list(result)
 
 data = []
@@ -50,7 +50,7 @@ for row in rows:
         'time': row['time'],
         'fields': {
             'count': row['count'],
-            'p100k': calculate_p100k(row['state'], row['count'])
+            'p100k': calculate_p100k(row['state'], row['count'], row['time'])
         }
     })
 
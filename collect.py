@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import importlib
+import sys
+import time
+import traceback
+from common import FetchError, NotModified, Unchanged, check_population, config, create_db_client, create_parse_pool, run
+from concurrent.futures import ThreadPoolExecutor
+
+
+STATES = ['bb', 'be', 'bw', 'by', 'hb', 'he', 'hh', 'mv', 'ni', 'nw', 'rp', 'sh', 'sl', 'sn', 'st', 'th']
+
+
+# Read on use, so importing STATES (e.g. in benchmark.py) works without a
+# config.json.
+def max_workers():
+    return config().get('collect', {}).get('max_workers', 8)
+
+
+def parse_workers():
+    return config().get('collect', {}).get('parse_workers')
+
+
+def collect_state(state, db_client, parse_pool=None):
+    start = time.monotonic()
+    dt = None
+
+    try:
+        dt = run(state, db_client, parse_pool=parse_pool)
+        status = 'updated at {}'.format(dt)
+    except NotModified:
+        status = 'not modified'
+    except Unchanged:
+        status = 'unchanged'
+    except FetchError as e:
+        status = str(e)
+    except Exception as e:
+        traceback.print_exc()
+        state.notify(str(e))
+        status = str(e)
+
+    return status, dt, time.monotonic() - start
+
+
+def warn_missing_population(states):
+    for state_short, county in check_population(states):
+        print('WARNING: {}: {} not found in population database.'.format(state_short, county))
+
+
+def collect(state_names, db_client):
+    states = [importlib.import_module(name) for name in state_names]
+    warn_missing_population(states)
+
+    with create_parse_pool(parse_workers()) as parse_pool, ThreadPoolExecutor(max_workers=max_workers()) as executor:
+        futures = [(state, executor.submit(collect_state, state, db_client, parse_pool)) for state in states]
+
+        return [(state, future.result()) for state, future in futures]
+
+
+def main():
+    state_names = sys.argv[1:] or STATES
+
+    db_client = create_db_client()
+
+    start = time.monotonic()
+    try:
+        results = collect(state_names, db_client)
+    finally:
+        db_client.close()
+
+    for state, (status, dt, elapsed) in results:
+        print('{}: {} ({:.2f}s)'.format(state.STATE_SHORT, status, elapsed))
+
+    print('Done in {:.2f}s.'.format(time.monotonic() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,566 @@
+import functools
+import hashlib
+import importlib
+import json
+import os
+import sys
+import threading
+import traceback
+from archive import Archive
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from populations import PopulationStore
+from urllib.parse import urlsplit
+
+
+BASE_PATH = os.path.dirname(os.path.realpath(__file__))
+CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
+POPULATION_PATH = os.path.join(BASE_PATH, 'population.bin')
+
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
+SINGLETONS_LOCK = threading.RLock()
+
+MISSING_POPULATION = set()
+
+# Article candidates of a two-hop state fetched at once, see fetch_article().
+PREFETCH_CANDIDATES = 3
+
+
+# Caches a function without arguments like functools.lru_cache, but builds the
+# object under a lock. The fetch threads start at once and would otherwise each
+# build their own cache, whose saves overwrite each other.
+def singleton(function):
+    instance = []
+
+    @functools.wraps(function)
+    def wrapper():
+        if not instance:
+            with SINGLETONS_LOCK:
+                if not instance:
+                    instance.append(function())
+
+        return instance[0]
+
+    return wrapper
+
+
+# config.json, the population store and the caches are loaded on first use, so
+# importing a state module stays cheap and works without a config.json.
+@singleton
+def config():
+    with open(CONFIG_PATH) as file:
+        return json.load(file)
+
+
+@singleton
+def population():
+    return PopulationStore(POPULATION_PATH)
+
+
+# Population of a county by the name the scrapers write, including composite
+# regions, as precomputed by transform.py. when selects the version valid at a
+# point's time (default: the newest). Raises KeyError if it is missing.
+def county_population(state_short, county, when=None):
+    inhabitants = population().county(state_short, county, when)
+    if inhabitants is None:
+        raise KeyError(county)
+
+    return inhabitants
+
+
+# A county without population is only reported once per process instead of
+# on every run.
+def report_missing_population(state_short, county):
+    if (state_short, county) in MISSING_POPULATION:
+        return
+
+    MISSING_POPULATION.add((state_short, county))
+    notify(state_short, '{} not found in population database.'.format(county))
+
+
+# Checks at startup that every county name the given states can write has a
+# population: the names of their counties, cities and composite regions in the
+# CSVs and the names their alias tables produce. Returns the missing (state,
+# county) pairs.
+def check_population(states):
+    import counties
+
+    missing = []
+    for state in states:
+        names = set(counties.csv_names(state.STATE_SHORT)) | set(counties.known_names(state.STATE))
+        for county in sorted(names):
+            if population().county(state.STATE_SHORT, county) is None:
+                missing.append((state.STATE_SHORT, county))
+
+    return missing
+
+
+def cache_path(name):
+    return os.path.join(config().get('cache_path', os.path.join(BASE_PATH, 'cache')), name)
+
+
+# Each state compiles its XPath expressions once at import. tree.xpath() with
+# a string compiles the expression again on every call, which adds up in the
+# per-row loops.
+def compile_xpaths(expressions):
+    from lxml import etree
+
+    return {name: etree.XPath(expression) for name, expression in expressions.items()}
+
+
+# Cuts the regions between each (start, end) marker pair out of a page with
+# plain string searches and builds a DOM of just those. Returns None if any
+# marker is missing.
+def html_fragments(html_text, markers):
+    from lxml import html
+
+    fragments = []
+    for start_marker, end_marker in markers:
+        start = html_text.find(start_marker)
+        if start == -1:
+            return None
+
+        end = html_text.find(end_marker, start)
+        if end == -1:
+            return None
+
+        fragments.append(html_text[start:end + len(end_marker)])
+
+    return html.fromstring('<div>{}</div>'.format(''.join(fragments)))
+
+
+# Runs parse_tree on a DOM of just the FRAGMENTS of a state's page. If a marker
+# is missing or one of FRAGMENT_XPATHS finds fewer results in the fragments
+# than the parser uses, the page layout changed: that is reported and the full
+# page is parsed instead. Errors raised by parse_tree itself are not caught.
+def parse_html(state, html_text, parse_tree):
+    from lxml import html
+
+    tree = html_fragments(html_text, state.FRAGMENTS)
+    if tree is None:
+        reason = 'fragment markers not found'
+    else:
+        missing = [name for name, count in state.FRAGMENT_XPATHS.items() if len(state.XPATHS[name](tree)) < count]
+        if not missing:
+            return parse_tree(tree)
+
+        reason = '{} not found in fragments'.format(', '.join(missing))
+
+    print('WARN: {}: {}, parsing the full page'.format(state.STATE_SHORT, reason))
+
+    return parse_tree(html.fromstring(html_text))
+
+
+class FetchError(Exception):
+    pass
+
+
+class NotModified(Exception):
+    pass
+
+
+class Unchanged(Exception):
+    pass
+
+
+class JsonStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        try:
+            with open(path, encoding='utf-8') as file:
+                self.data = json.load(file)
+        except FileNotFoundError:
+            self.data = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.data, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class ValidatorCache(JsonStore):
+    def headers(self, url):
+        validator = self.data.get(url, {})
+
+        headers = {}
+        if 'etag' in validator:
+            headers['If-None-Match'] = validator['etag']
+        if 'last_modified' in validator:
+            headers['If-Modified-Since'] = validator['last_modified']
+
+        return headers
+
+    def update(self, responses):
+        with self.lock:
+            for url, r in responses:
+                validator = {}
+                if 'ETag' in r.headers:
+                    validator['etag'] = r.headers['ETag']
+                if 'Last-Modified' in r.headers:
+                    validator['last_modified'] = r.headers['Last-Modified']
+
+                if validator:
+                    self.data[url] = validator
+                else:
+                    self.data.pop(url, None)
+
+            self.save()
+
+
+class FingerprintStore(JsonStore):
+    def get(self, state_short):
+        return self.data.get(state_short)
+
+    def update(self, state_short, fingerprint):
+        with self.lock:
+            self.data[state_short] = fingerprint
+            self.save()
+
+
+class ArticleCache(JsonStore):
+    def get(self, state_short, day):
+        article = self.data.get(state_short)
+        if not article or article['day'] != day:
+            return None
+
+        return article['url']
+
+    def update(self, state_short, day, url):
+        with self.lock:
+            self.data[state_short] = {'day': day, 'url': url}
+            self.save()
+
+
+# Rolling state of every series (state total or county) for the derived
+# fields, see observations.advance(). Only updated once the points are
+# written.
+class SeriesStore(JsonStore):
+    def history(self, key):
+        return self.data.get(key, [])
+
+    def update(self, histories):
+        with self.lock:
+            self.data.update(histories)
+            self.save()
+
+
+def archive_path():
+    return config().get('archive_path', os.path.join(BASE_PATH, 'archive'))
+
+
+@singleton
+def archive():
+    return Archive(archive_path())
+
+
+@singleton
+def validators():
+    return ValidatorCache(cache_path('validators.json'))
+
+
+@singleton
+def fingerprints():
+    return FingerprintStore(cache_path('fingerprints.json'))
+
+
+@singleton
+def articles():
+    return ArticleCache(cache_path('articles.json'))
+
+
+@singleton
+def series():
+    return SeriesStore(cache_path('series.json'))
+
+
+def today():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+def prefetch_candidates():
+    return config().get('prefetch', {}).get('candidates', PREFETCH_CANDIDATES)
+
+
+# Fetches the sources of a single state run. Requests carry the validators of
+# the last successful run and a 304 on any of them raises NotModified. The
+# fetched bodies are hashed into a fingerprint, and check_unchanged() raises
+# Unchanged if it matches the last successful run. New validators and the
+# fingerprint are only saved by commit(), so a failed parse is retried in full.
+# Every successful response is archived as soon as it arrives, so the raw
+# sources of a run survive even if parsing it fails. Candidates that may not
+# be used (conditional=False) are fetched without validators and only count
+# once accept() is called for them.
+class Fetcher:
+    def __init__(self, state_short):
+        self.state_short = state_short
+        self.responses = []
+        self.fingerprint = hashlib.sha256()
+        self.article_url = None
+        self.candidates = prefetch_candidates()
+
+    def get(self, url, fingerprint=True, conditional=True):
+        if not conditional:
+            r = http_get(url)
+        else:
+            r = http_get(url, headers=validators().headers(url))
+            if r.status_code == 304:
+                raise NotModified('Data not modified: {}'.format(url))
+
+            self.responses.append((url, r))
+
+        if r.ok:
+            if fingerprint and conditional:
+                self.fingerprint.update(r.content)
+
+            time = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            archive().add(self.state_short, time, url, r.content, r.encoding)
+
+        return r
+
+    def accept(self, url, r):
+        self.responses.append((url, r))
+        self.fingerprint.update(r.content)
+
+    def cached_article(self):
+        return articles().get(self.state_short, today())
+
+    def check_unchanged(self):
+        if fingerprints().get(self.state_short) == self.fingerprint.hexdigest():
+            validators().update(self.responses)
+            raise Unchanged('Data unchanged since last run')
+
+    def commit(self):
+        validators().update(self.responses)
+        fingerprints().update(self.state_short, self.fingerprint.hexdigest())
+
+        if self.article_url:
+            articles().update(self.state_short, today(), self.article_url)
+
+
+# Base for fetchers that answer from recorded responses (fixtures, the
+# archive). Nothing is validated, fingerprinted or cached, and no config.json
+# is needed.
+class RecordedFetcher:
+    article_url = None
+    candidates = PREFETCH_CANDIDATES
+
+    def accept(self, url, r):
+        pass
+
+    def cached_article(self):
+        return None
+
+
+def _fetch_candidate(fetcher, url):
+    try:
+        return fetcher.get(url, conditional=False)
+    except Exception:
+        return None
+
+
+# Fetches the data article of a two-hop state. The article cached for the poll
+# day is fetched directly. Otherwise the first candidates returned by search()
+# are fetched concurrently and the first one in search order that
+# article_date() recognizes as a data article is used, without parsing it.
+# Only an article dated on the poll day is cached: one polled before today's
+# release would otherwise hide the new article (and its 304s would stop every
+# later poll) for the rest of the day.
+def fetch_article(fetcher, search, article_date):
+    url = fetcher.cached_article()
+    if url:
+        r = fetcher.get(url)
+        if r.ok:
+            fetcher.article_url = url
+            return r.text
+
+    urls = search(fetcher)[:fetcher.candidates]
+
+    executor = ThreadPoolExecutor(max_workers=len(urls))
+    try:
+        futures = [(url, executor.submit(_fetch_candidate, fetcher, url)) for url in urls]
+
+        for url, future in futures:
+            r = future.result()
+            if r is None or not r.ok:
+                continue
+
+            day = article_date(r.text)
+            if not day:
+                continue
+
+            fetcher.accept(url, r)
+            if day == today():
+                fetcher.article_url = url
+
+            return r.text
+    finally:
+        executor.shutdown(wait=False)
+
+    raise FetchError('ERROR: no candidate is a data article: {}'.format(', '.join(urls)))
+
+
+def _session(url):
+    host = urlsplit(url).netloc
+
+    with SESSIONS_LOCK:
+        session = SESSIONS.get(host)
+        if not session:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            pool_size = config().get('http', {}).get('pool_size', 4)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+            session = requests.Session()
+            session.headers['User-Agent'] = config()['user_agent']
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            SESSIONS[host] = session
+
+    return session
+
+
+# Without a timeout a stalled host would block a runner or scheduler thread
+# forever.
+def _timeout():
+    return config().get('http', {}).get('timeout', 30)
+
+
+def http_get(url, **kwargs):
+    kwargs.setdefault('timeout', _timeout())
+    return _session(url).get(url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    kwargs.setdefault('timeout', _timeout())
+    return _session(url).post(url, **kwargs)
+
+
+def notify(state_short, msg):
+    print(msg)
+
+    pushover = config().get('pushover')
+    if not pushover:
+        return
+
+    http_post(
+        'https://api.pushover.net/1/messages.json',
+        json={
+            'token': pushover['token'],
+            'user': pushover['user'],
+            'title': 'Corona {}: Fehler!'.format(state_short),
+            'message': msg
+        }
+    )
+
+
+def create_db_client():
+    import influxdb
+
+    db_config = config()['db']
+
+    db_client = influxdb.InfluxDBClient(
+        host=db_config['host'],
+        port=db_config['port'],
+        username=db_config['username'],
+        password=db_config['password']
+    )
+    db_client.switch_database(db_config['database'])
+
+    return db_client
+
+
+# The process pool for parsing. Its workers are started by a fork server: the
+# first submit() comes from a fetch thread, and forking while other threads
+# hold locks (SESSIONS_LOCK, requests' pools) can deadlock the workers.
+def create_parse_pool(max_workers=None):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('forkserver'))
+
+
+# data is a list of points or an observations.Batch. A batch also gets the
+# derived fields from the rolling series state.
+def store(db_client, data, debug=False, batch_size=None):
+    from observations import Batch
+
+    histories = None
+    if isinstance(data, Batch):
+        derived, histories = data.derived(series())
+        data = data.points(derived)
+    else:
+        data = list(data)
+
+    if debug:
+        print(data)
+        return
+
+    import influxdb
+
+    try:
+        if not db_client.write_points(data, batch_size=batch_size):
+            raise Exception('ERROR: CoronaParser: _store: false')
+    except influxdb.exceptions.InfluxDBServerError as e:
+        raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
+    except influxdb.exceptions.InfluxDBClientError as e:
+        raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
+
+    if histories:
+        series().update(histories)
+
+
+def parse_state(name, payload):
+    return importlib.import_module(name).parse(payload)
+
+
+# Fetching and storing happen on the calling thread. If a process pool is
+# given, the CPU-bound parse step runs there and only the fetched payload and
+# the parsed points cross the process boundary.
+def run(state, db_client, *args, parse_pool=None):
+    fetcher = Fetcher(state.STATE_SHORT)
+
+    payload = state.fetch(fetcher, *args)
+
+    fetcher.check_unchanged()
+
+    if parse_pool:
+        dt, data = parse_pool.submit(parse_state, state.__name__, payload).result()
+    else:
+        dt, data = state.parse(payload)
+
+    state.store(db_client, data)
+
+    fetcher.commit()
+
+    return dt
+
+
+def main(state, args):
+    if state.DEBUG:
+        db_client = None
+    else:
+        db_client = create_db_client()
+
+    try:
+        dt = run(state, db_client, *args)
+        print('Data updated at {}'.format(dt))
+    except (NotModified, Unchanged) as e:
+        print(e)
+    except FetchError as e:
+        print(e)
+        sys.exit(1)
+    except Exception as e:
+        traceback.print_exc()
+        state.notify(str(e))
+    finally:
+        if db_client:
+            db_client.close()
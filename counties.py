@@ -0,0 +1,269 @@
+import csv
+import functools
+import os
+
+BASE_PATH = os.path.dirname(os.path.realpath(__file__))
+COUNTIES_CSV_PATH = os.path.join(BASE_PATH, 'counties.csv')
+CITIES_CSV_PATH = os.path.join(BASE_PATH, 'cities.csv')
+
+# Counties are resolved by their name and kreisfreie cities by their name with
+# ' (Stadt)', as the scrapers write them. The states listed here write city
+# names without the suffix; the value says whether the city or the county wins
+# if both have the same name.
+CITY_NAMES = {
+    'BB': 'city',
+    'HB': 'city',
+    'SH': 'county',
+    'TH': 'city'
+}
+
+# Regions a state reports as one, resolved to the sum of their parts.
+COMPOSITES = {
+    'NI': {
+        'Region Hannover': [('city', 'Hannover'), ('county', 'Hannover')]
+    },
+    'NW': {
+        'Aachen & Städteregion Aachen': [('city', 'Aachen'), ('county', 'Aachen')]
+    }
+}
+
+
+# County name aliases. The raw county names of a state's source are mapped to
+# the names used in the database (and population.json) by the state's rules.
+# A rule matches names starting with its prefix and ending with its suffix,
+# strips both, replaces the remaining name if it is listed in names and formats
+# it. A rule without prefix and suffix only matches the names it lists, unless
+# it is a fallback, which matches every name. Names not matched by any rule are
+# kept as they are.
+class Rule:
+    def __init__(self, prefix='', suffix='', format='{}', names=None, fallback=False):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.format = format
+        self.names = names or {}
+        self.fallback = fallback
+
+    def match(self, county):
+        if not self.prefix and not self.suffix and not self.fallback:
+            return county in self.names
+
+        return len(county) > len(self.prefix) + len(self.suffix) and county.startswith(self.prefix) and county.endswith(self.suffix)
+
+    def apply(self, county):
+        name = county[len(self.prefix):len(county) - len(self.suffix)]
+
+        return self.format.format(self.names.get(name, name))
+
+
+ALIASES = {
+    'Baden-Württemberg': [
+        Rule(names={
+            'Stuttgart': 'Stuttgart (Stadt)'
+        }),
+        Rule(suffix=' (Stadtkreis)', format='{} (Stadt)')
+    ],
+    'Bayern': [
+        Rule(suffix=' Stadt', format='{} (Stadt)', names={
+            'Kempten': 'Kempten (Allgäu)',
+            'Weiden': 'Weiden in der Oberpfalz'
+        }),
+        Rule(names={
+            'Bad Tölz': 'Bad Tölz-Wolfratshausen',
+            'Dillingen a.d. Donau': 'Dillingen an der Donau',
+            'Mühldorf a.Inn': 'Mühldorf am Inn',
+            'Neumarkt i.d.Opf.': 'Neumarkt in der Oberpfalz',
+            'Neustadt a.d. Aisch-Bad Windsheim': 'Neustadt an der Aisch-Bad Windsheim',
+            'Neustadt a.d. Waldnaab': 'Neustadt an der Waldnaab',
+            'Pfaffenhofen a.d.Ilm': 'Pfaffenhofen an der Ilm',
+            'Wunsiedel i.Fichtelgebirge': 'Wunsiedel im Fichtelgebirge',
+            # Stored before Weiden was spelled out.
+            'Weiden (Stadt)': 'Weiden in der Oberpfalz (Stadt)'
+        })
+    ],
+    'Brandenburg': [
+        Rule(names={
+            'Brandenburg a. d. H.': 'Brandenburg an der Havel',
+            'Brandenburg a. d. Havel': 'Brandenburg an der Havel'
+        })
+    ],
+    'Bremen': [
+        Rule(prefix='Stadtgemeinde ')
+    ],
+    'Hessen': [
+        Rule(prefix='SK ', format='{} (Stadt)', names={
+            'Frankfurtam Main': 'Frankfurt am Main',
+            'Offenbach': 'Offenbach am Main'
+        }),
+        Rule(prefix='LK ', names={
+            'Hochtaunus-kreis': 'Hochtaunuskreis',
+            'Odenwald-kreis': 'Odenwaldkreis',
+            'Vogelsberg-kreis': 'Vogelsbergkreis',
+            'Wetterau-kreis': 'Wetteraukreis'
+        })
+    ],
+    'Mecklenburg-Vorpommern': [
+        Rule(names={
+            'Schwerin': 'Schwerin (Stadt)',
+            'Hansestadt Rostock': 'Rostock (Stadt)',
+            'Landkreis Rostock': 'Rostock'
+        })
+    ],
+    'Niedersachsen': [
+        Rule(prefix='SK ', format='{} (Stadt)'),
+        Rule(prefix='LK ', names={
+            'Nienburg (Weser)': 'Nienburg/Weser'
+        }),
+        # Stored without the prefix.
+        Rule(names={
+            'Nienburg (Weser)': 'Nienburg/Weser'
+        })
+    ],
+    'Nordrhein-Westfalen': [
+        Rule(suffix=' (Kreis)'),
+        # Kreise named without the (Kreis) suffix, everything else is a city.
+        Rule(names={name: name for name in [
+            'Aachen & Städteregion Aachen',
+            'Ennepe-Ruhr-Kreis',
+            'Hochsauerlandkreis',
+            'Märkischer Kreis',
+            'Oberbergischer Kreis',
+            'Rhein-Erft-Kreis',
+            'Rhein-Kreis Neuss',
+            'Rhein-Sieg-Kreis',
+            'Rheinisch-Bergischer Kreis'
+        ]}),
+        Rule(format='{} (Stadt)', fallback=True, names={
+            'Mülheim / Ruhr': 'Mülheim an der Ruhr'
+        })
+    ],
+    'Rheinland-Pfalz': [
+        Rule(prefix='KS ', format='{} (Stadt)', names={
+            'Frankenthal': 'Frankenthal (Pfalz)',
+            'Landau i.d. Pfalz': 'Landau in der Pfalz',
+            'Landau i.d.Pfalz': 'Landau in der Pfalz',
+            'Ludwigshafen': 'Ludwigshafen am Rhein',
+            'Neustadt Weinst.': 'Neustadt an der Weinstraße'
+        }),
+        Rule(prefix='LK ', names={
+            'Altenkirchen': 'Altenkirchen (Westerwald)',
+            'Bitburg-Prüm': 'Eifelkreis Bitburg-Prüm',
+            'Rhein-Hunsrück': 'Rhein-Hunsrück-Kreis',
+            'Südliche Weinstr.': 'Südliche Weinstraße'
+        }),
+        # Stored without the prefixes, before the counties and cities were
+        # told apart. Kaiserslautern is left out, the bare name is the county.
+        Rule(names={
+            'Altenkirchen': 'Altenkirchen (Westerwald)',
+            'Bitburg-Prüm': 'Eifelkreis Bitburg-Prüm',
+            'Rhein-Hunsrück': 'Rhein-Hunsrück-Kreis',
+            'Südliche Weinstr.': 'Südliche Weinstraße',
+            'Frankenthal': 'Frankenthal (Pfalz) (Stadt)',
+            'Koblenz': 'Koblenz (Stadt)',
+            'Landau i.d.Pfalz': 'Landau in der Pfalz (Stadt)',
+            'Ludwigshafen': 'Ludwigshafen am Rhein (Stadt)',
+            'Mainz': 'Mainz (Stadt)',
+            'Neustadt Weinst.': 'Neustadt an der Weinstraße (Stadt)',
+            'Pirmasens': 'Pirmasens (Stadt)',
+            'Speyer': 'Speyer (Stadt)',
+            'Trier': 'Trier (Stadt)',
+            'Worms': 'Worms (Stadt)',
+            'Zweibrücken': 'Zweibrücken (Stadt)'
+        })
+    ],
+    'Sachsen': [
+        Rule(prefix='Landkreis '),
+        Rule(prefix='Landeshauptstadt ', format='{} (Stadt)'),
+        Rule(prefix='Stadt ', format='{} (Stadt)')
+    ],
+    'Sachsen-Anhalt': [
+        Rule(prefix='SK ', format='{} (Stadt)', names={
+            'Dessau': 'Dessau-Roßlau',
+            'Halle': 'Halle (Saale)'
+        }),
+        Rule(prefix='LK ', names={
+            'Anhalt Bitterfeld': 'Anhalt-Bitterfeld'
+        }),
+        # Stored without the prefix.
+        Rule(names={
+            'Anhalt Bitterfeld': 'Anhalt-Bitterfeld'
+        })
+    ]
+}
+
+
+# Compiles the rules of a state into a dict of every raw name the rules list
+# and the anchored rules for all other names. A resolved name is added to the
+# dict, so each raw name is matched against the rules only once.
+class Resolver:
+    def __init__(self, rules):
+        self.rules = rules
+        self.names = {}
+
+        for county in self._known_names():
+            self.names[county] = self._apply(county)
+
+    def _known_names(self):
+        for rule in self.rules:
+            for name in rule.names:
+                yield '{}{}{}'.format(rule.prefix, name, rule.suffix)
+
+    def _apply(self, county):
+        for rule in self.rules:
+            if rule.match(county):
+                return rule.apply(county)
+
+        return county
+
+    def resolve(self, county):
+        try:
+            return self.names[county]
+        except KeyError:
+            name = self.names[county] = self._apply(county)
+            return name
+
+
+RESOLVERS = {state: Resolver(rules) for state, rules in ALIASES.items()}
+
+
+# The names the rules of a state map their listed raw names to.
+def known_names(state):
+    resolver = RESOLVERS.get(state)
+    if not resolver:
+        return []
+
+    return sorted(set(resolver.resolve(county) for county in resolver._known_names()))
+
+
+def city_name(state_short, city):
+    if state_short in CITY_NAMES:
+        return city
+
+    return '{} (Stadt)'.format(city)
+
+
+# The names the scrapers write for the counties and cities of a state in
+# counties.csv and cities.csv, and for its composite regions. These are the
+# names transform.py resolves.
+@functools.lru_cache(maxsize=None)
+def csv_names(state_short):
+    names = set(COMPOSITES.get(state_short, {}))
+
+    with open(COUNTIES_CSV_PATH, encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            if row['state'] == state_short:
+                names.add(row['county'])
+
+    with open(CITIES_CSV_PATH, encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            if row['state'] == state_short:
+                names.add(city_name(state_short, row['city']))
+
+    return sorted(names)
+
+
+def resolve(state, county):
+    resolver = RESOLVERS.get(state)
+    if not resolver:
+        return county
+
+    return resolver.resolve(county)
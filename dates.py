@@ -0,0 +1,78 @@
+import functools
+import re
+from datetime import datetime
+
+
+MONTHS = {
+    'januar': 1,
+    'februar': 2,
+    'märz': 3,
+    'maerz': 3,
+    'april': 4,
+    'mai': 5,
+    'juni': 6,
+    'juli': 7,
+    'august': 8,
+    'september': 9,
+    'oktober': 10,
+    'november': 11,
+    'dezember': 12
+}
+
+WEEKDAYS = ['montag', 'dienstag', 'mittwoch', 'donnerstag', 'freitag', 'samstag', 'sonntag']
+
+DIRECTIVES = {
+    'd': r'(?P<d>\d{1,2})',
+    'm': r'(?P<m>\d{1,2})',
+    'Y': r'(?P<Y>\d{4})',
+    'H': r'(?P<H>\d{1,2})',
+    'M': r'(?P<M>\d{1,2})',
+    'S': r'(?P<S>\d{1,2})',
+    'B': r'(?P<B>{})'.format('|'.join(MONTHS)),
+    'A': r'(?:{})'.format('|'.join(WEEKDAYS)),
+    '%': '%'
+}
+
+
+# Translates a strptime format into a regular expression. Like strptime,
+# whitespace in the format matches any run of whitespace and names are matched
+# case-insensitively.
+@functools.lru_cache(maxsize=None)
+def _compile(format):
+    pattern = ''
+    for part in re.split(r'(%.|\s+)', format):
+        if part.startswith('%'):
+            pattern += DIRECTIVES[part[1]]
+        elif part.isspace():
+            pattern += r'\s+'
+        else:
+            pattern += re.escape(part)
+
+    return re.compile(pattern, re.IGNORECASE)
+
+
+# A locale independent replacement for datetime.strptime with German month
+# (%B) and weekday (%A) names. It doesn't touch the process-wide locale, so
+# states can be parsed concurrently, and repeated strings are served from the
+# cache. Missing fields default like strptime (1900-01-01 00:00:00).
+@functools.lru_cache(maxsize=1024)
+def strptime(text, format):
+    match = _compile(format).fullmatch(text)
+    if not match:
+        raise ValueError('time data {!r} does not match format {!r}'.format(text, format))
+
+    values = match.groupdict()
+
+    if values.get('B'):
+        month = MONTHS[values['B'].lower()]
+    else:
+        month = int(values.get('m') or 1)
+
+    return datetime(
+        int(values.get('Y') or 1900),
+        month,
+        int(values.get('d') or 1),
+        int(values.get('H') or 0),
+        int(values.get('M') or 0),
+        int(values.get('S') or 0)
+    )
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+# Rebuilds fixtures/ for benchmark.py. The ministry pages are not reachable
+# from the build machine, so the fixtures are synthetic: each page has the
+# structure its parser selects, real county names (including the spellings
+# the states use) and random numbers, padded with navigation and footer markup
+# to a realistic page size. The numbers are seeded, so running this again
+# yields the same files (the workbook differs only in its timestamps).
+
+import csv
+import datetime
+import io
+import json
+import openpyxl
+import os
+import random
+
+BASE_PATH = os.path.dirname(os.path.realpath(__file__))
+FIXTURES_PATH = os.path.join(BASE_PATH, 'fixtures')
+POPULATION_JSON_PATH = os.path.join(BASE_PATH, 'population.json')
+
+with open(POPULATION_JSON_PATH, encoding='utf-8') as file:
+    POPULATION = json.load(file)
+
+RANDOM = random.Random(42)
+
+
+def path(state, name):
+    os.makedirs(os.path.join(FIXTURES_PATH, state), exist_ok=True)
+    return os.path.join(FIXTURES_PATH, state, name)
+
+
+def format_number(n):
+    return '{:,}'.format(n).replace(',', '.')
+
+
+def filler(n):
+    parts = ['<nav><ul>']
+    for i in range(n):
+        parts.append('<li class="nav-item level-{}"><a href="/de/bereich-{}/seite-{}/">Navigationspunkt {} mit etwas Text</a></li>'.format(i % 4, i % 13, i, i))
+    parts.append('</ul></nav>')
+    parts.append('<script type="text/javascript">var config = {};</script>'.format(json.dumps({'k%d' % i: 'v' * 20 for i in range(50)})))
+    return '\n'.join(parts)
+
+
+def footer(n):
+    return '<footer>' + ''.join('<div class="footer-col"><p>Impressum Datenschutz Kontakt Barrierefreiheit {}</p></div>'.format(i) for i in range(n)) + '</footer>'
+
+
+def page(body, title='Seite', n=400):
+    return '<!DOCTYPE html>\n<html lang="de"><head><meta charset="utf-8"><title>{}</title><link rel="stylesheet" href="/style.css"></head><body>{}<main>{}</main>{}</body></html>\n'.format(title, filler(n), body, footer(n // 4))
+
+
+def write(state, name, text):
+    with open(path(state, name), 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+def random_counts():
+    infected = RANDOM.randint(20, 2500)
+    return infected, RANDOM.randint(0, infected // 20)
+
+
+# BY
+rows = []
+for c in POPULATION['county']['BY']:
+    raw = {'Bad Tölz-Wolfratshausen': 'Bad Tölz', 'Dillingen an der Donau': 'Dillingen a.d. Donau', 'Mühldorf am Inn': 'Mühldorf a.Inn',
+           'Neumarkt in der Oberpfalz': 'Neumarkt i.d.Opf.', 'Neustadt an der Aisch-Bad Windsheim': 'Neustadt a.d. Aisch-Bad Windsheim',
+           'Neustadt an der Waldnaab': 'Neustadt a.d. Waldnaab', 'Pfaffenhofen an der Ilm': 'Pfaffenhofen a.d.Ilm',
+           'Wunsiedel im Fichtelgebirge': 'Wunsiedel i.Fichtelgebirge'}.get(c, c)
+    rows.append(raw)
+for c in POPULATION['city']['BY']:
+    raw = {'Kempten (Allgäu)': 'Kempten', 'Weiden in der Oberpfalz': 'Weiden'}.get(c, c)
+    rows.append(raw + ' Stadt')
+trs = ['<tr><th><span>Landkreis/Stadt</span></th><th><span>Anzahl</span></th>' + '<th><span>x</span></th>' * 6 + '</tr>']
+infected_sum = death_sum = 0
+for raw in sorted(rows):
+    infected, death = random_counts()
+    infected_sum += infected
+    death_sum += death
+    trs.append('<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format(raw, format_number(infected), infected % 7, format_number(infected * 3), '12,3', '+5', format_number(death) if death else '-', '1'))
+trs.append('<tr><td>Gesamtergebnis</td><td>{}</td><td>1</td><td>1</td><td>1</td><td>1</td><td>{}</td><td>1</td></tr>'.format(format_number(infected_sum), format_number(death_sum)))
+body = '''<div id="content_1c"><h1>Übersicht der Fallzahlen</h1><script>var datum = "31.03.2020"</script>
+<p class="bildunterschrift"><strong>Karte</strong> <strong>Stand:</strong> <strong>, 10:00 Uhr</strong></p>
+<div class="row abstand_unten"><div class="col"><table class="tabelle">{}</table></div></div></div>'''.format(''.join(trs))
+write('by', '1_data.html', page(body))
+
+# BB
+bb_rows = ['<tr><td><p><strong>Landkreis</strong></p></td><td><p>neu</p></td><td><p><strong>Fälle</strong><strong>Stand: 31.03., 08:00 Uhr</strong></p></td><td><p>Tote</p></td></tr>']
+names = list(POPULATION['county']['BB']) + ['Brandenburg a. d. H.' if c == 'Brandenburg an der Havel' else c for c in POPULATION['city']['BB']]
+for n in names:
+    infected, death = random_counts()
+    bb_rows.append('<tr><td><p><strong>{}*</strong></p></td><td><p>{}</p></td><td><p>{}</p></td><td><p>{}</p></td></tr>'.format(n, infected % 9, infected, death or ' '))
+bb_rows.append('<tr><td><p><strong>Brandenburg gesamt</strong></p></td><td><p>1</p></td><td><p>1</p></td><td><p>1</p></td></tr>')
+write('bb', '2_data.html', page('<article><h1>Bestätigte COVID-19-Fälle</h1><table><tbody>{}</tbody></table></article>'.format(''.join(bb_rows))))
+posts = ''.join('<div class="bb-teaser-item"><h2><a href="/msgiv/de/presse/pressemitteilungen/detail/~{}">{}</a></h2><p>Teaser</p></div>'.format(
+    i, 'Aktuelle Zahl der COVID-19-Fälle im Land Brandenburg' if i == 3 else 'Pressemitteilung Nummer {}'.format(i)) for i in range(10))
+write('bb', '1_search.html', page('<form action="filterform"><div class="trennung medium-12 ">{}</div></form>'.format(posts)))
+
+# BE
+lis = []
+for i in range(20):
+    title = 'Coronavirus: 2.462 bestätigte Fälle in Berlin' if i == 4 else 'Senatorin besucht Einrichtung Nummer {}'.format(i)
+    lis.append('<li class="row-fluid"><div class="span2 cell date">{:02d}.03.2020 14:30 Uhr</div><div class="span10 cell text"><a href="/sen/gpg/service/presse/2020/pressemitteilung.{}.php">{}</a></div></li>'.format(31 - i // 2, 900000 + i, title))
+write('be', '1_data.html', page('<ul class="list-autoteaser">{}</ul>'.format(''.join(lis))))
+
+# BW
+bw_html = page('<div class="content"><figure><img src="/karte.png"><figcaption>Tabelle: Fälle nach Stadt- und Landkreisen (Stand: 31. März 2020, 16:00 Uhr)</figcaption></figure>'
+               '<p><a class="link-download" href="fileadmin/redaktion/m-sm/intern/downloads/Downloads_Gesundheitsschutz/200331_COVID_Tabelle_Kreise.xlsx">Tabelle (XLSX)</a></p></div>')
+write('bw', '1_data.html', bw_html)
+wb = openpyxl.Workbook()
+ws_i = wb.active
+ws_i.title = 'Infizierte Coronavirus in BW'
+ws_d = wb.create_sheet('Todesfälle Coronavirus in BW')
+bw_names = ['Stuttgart'] + [c + ' (Stadtkreis)' for c in POPULATION['city']['BW'] if c != 'Stuttgart'] + list(POPULATION['county']['BW'])
+days = 30
+for ws in (ws_i, ws_d):
+    ws['A1'] = 'Bestätigte Fälle Baden-Württemberg'
+    ws['A2'] = 'Quelle: Landesgesundheitsamt'
+    ws['A4'] = 'Stadt-/Landkreis'
+    for j in range(days):
+        ws.cell(row=5, column=2 + j, value=datetime.datetime(2020, 3, 31) - datetime.timedelta(days=j))
+for r, n in enumerate(bw_names):
+    infected, death = random_counts()
+    ws_i.cell(row=6 + r, column=1, value=n)
+    ws_d.cell(row=6 + r, column=1, value=n)
+    for j in range(days):
+        ws_i.cell(row=6 + r, column=2 + j, value=max(0, infected - j * 10))
+        ws_d.cell(row=6 + r, column=2 + j, value=max(0, death - j))
+ws_i.cell(row=6 + len(bw_names), column=1, value='Summe')
+ws_d.cell(row=6 + len(bw_names), column=1, value='Summe')
+wb.save(path('bw', '2_table.xlsx'))
+
+# HB
+hb_rows = ['<tr><th>Gebiet</th><th>Bestätigte Fälle insgesamt</th><th>a</th><th>b</th><th>c</th><th>Tote</th></tr>']
+for n in POPULATION['city']['HB']:
+    infected, death = random_counts()
+    hb_rows.append('<tr><th>Stadtgemeinde {}</th><td>x</td><td>{} (+4)</td><td>1</td><td>2</td><td>{} (+0)</td></tr>'.format(n, infected, death))
+hb_rows.append('<tr><th>Land Bremen</th><td>x</td><td>1</td><td>1</td><td>1</td><td>1</td></tr>')
+write('hb', '2_data.html', page('<div class="article"><span class="article_time">31.03.2020</span><h1>Aktueller Stand Corona</h1><table>{}</table></div>'.format(''.join(hb_rows))))
+hits = ''.join('<li><a href="sixcms/detail.php?gsid=bremen146.c.{}.de">{}</a></li>'.format(
+    330000 + i, 'Aktueller Stand Corona-Virus (31.03.2020)' if i == 2 else 'Corona: Hinweise zum Umgang Nummer {}'.format(i)) for i in range(10))
+write('hb', '1_search.html', page('<ul class="searchhits">{}</ul>'.format(hits)))
+
+# HE
+he_rows = ['<tr><td><p>Kreis/Stadt</p></td><td><p>kumuliert</p></td><td><p>Tote</p></td><td><p>a</p></td><td><p>b</p></td><td><p>c</p></td></tr>']
+names = ['LK ' + {'Hochtaunuskreis': 'Hochtaunus-kreis', 'Odenwaldkreis': 'Odenwald-kreis', 'Vogelsbergkreis': 'Vogelsberg-kreis', 'Wetteraukreis': 'Wetterau-kreis'}.get(c, c) for c in POPULATION['county']['HE']]
+names += ['SK ' + {'Frankfurt am Main': 'Frankfurtam Main', 'Offenbach am Main': 'Offenbach'}.get(c, c) for c in POPULATION['city']['HE']]
+for n in names:
+    infected, death = random_counts()
+    he_rows.append('<tr><td><p><strong>{}</strong></p></td><td><p>{}</p></td><td><p>{}</p></td><td><p>1</p></td><td><p>2</p></td><td><p>3</p></td></tr>'.format(n, format_number(infected), format_number(death) if death else ' '))
+he_rows.append('<tr><td><p>Gesamt</p></td><td><p>1</p></td><td><p>1</p></td><td><p>1</p></td><td><p>1</p></td><td><p>1</p></td></tr>')
+write('he', '1_data.html', page('<div class="he_content_body"><p><strong>Übersicht, Stand 31. März 2020, 14:00 Uhr, Hessisches Ministerium für Soziales und Integration</strong></p><table><tbody>{}</tbody></table></div>'.format(''.join(he_rows))))
+
+# HH
+write('hh', '1_data.html', page('<div class="row"><span class="chart_publication">Stand: Dienstag, 31. März 2020;</span>'
+                      '<div class="teaser teaser-thumb col-xs-12 col-md-6 col-xl-4"><div class="c_chart one"><h2 class="c_chart_h2">1965</h2><p>Bestätigte Fälle</p></div></div>'
+                      '<div class="teaser teaser-thumb col-xs-12 col-md-6 col-xl-4"><div class="c_chart two"><h2 class="c_chart_h2">2</h2></div></div></div>'))
+
+# MV
+mv_rows = ['<tr><td><p>Corona-positiv getestete Personen</p></td></tr>', '<tr><td><p><strong>Übersicht</strong><strong>Stand 31.03. 14:00 Uhr</strong></p></td></tr>',
+           '<tr><td><p>Kreis/kreisfreie Stadt</p></td><td><p>a</p></td><td><p>Fälle</p></td><td><p>b</p></td></tr>']
+names = ['Schwerin', 'Hansestadt Rostock', 'Landkreis Rostock'] + [c for c in POPULATION['county']['MV'] if c != 'Rostock']
+for n in names:
+    infected, death = random_counts()
+    mv_rows.append('<tr><td><p>{}</p></td><td><p>{}</p></td><td><p>{}</p></td><td><p>{}</p></td></tr>'.format(n, infected % 5, infected, death))
+mv_rows.append('<tr><td><p>Summe</p></td><td><p>1</p></td><td><p>1</p></td><td><p>1</p></td></tr>')
+write('mv', '2_data.html', page('<div class="article"><table>{}</table></div>'.format(''.join(mv_rows))))
+write('mv', '1_search.html', page('<div class="resultlist">{}</div>'.format(''.join(
+    '<div class="teaser teaser-{}"><h3><a href="/Landesregierung/wm/Aktuell/?id={}&amp;processor=processor.sa.pressemitteilung">Aktueller Stand Corona-Infektionen {}</a></h3></div>'.format(i, 158000 + i, i) for i in range(10)))))
+
+# NI
+ps = ''.join('<p><b>Info {}</b></p>'.format(i) for i in range(6)) + '<p><b>Datenstand: 31.03.2020 09:00 Uhr</b></p>'
+write('ni', '1_data.html', page('<div class="iframe">{}</div>'.format(ps), n=50))
+out = io.StringIO()
+w = csv.writer(out, delimiter=';', lineterminator='\n')
+w.writerow(['Landkreis', 'bestätigte Fälle', 'Inzidenz', 'verstorbene Fälle', 'genesen'])
+names = ['LK ' + ('Nienburg (Weser)' if c == 'Nienburg/Weser' else c) for c in POPULATION['county']['NI'] if c != 'Hannover'] + ['Region Hannover']
+names += ['SK ' + c for c in POPULATION['city']['NI'] if c != 'Hannover']
+for n in names:
+    infected, death = random_counts()
+    w.writerow([n, infected, '12,3', death, infected // 2])
+with open(path('ni', '2_table.csv'), 'w', encoding='utf-8') as file:
+    file.write(out.getvalue())
+
+# NW
+nw_rows = []
+names = [c if 'kreis' in c.lower() else '{} (Kreis)'.format(c) for c in POPULATION['county']['NW'] if c != 'Aachen']
+names += ['Mülheim / Ruhr' if c == 'Mülheim an der Ruhr' else c for c in POPULATION['city']['NW'] if c != 'Aachen']
+names += ['Aachen & Städteregion Aachen']
+for n in sorted(names):
+    infected, death = random_counts()
+    nw_rows.append('<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format(n, format_number(infected), format_number(death) if death else '-', '12,3'))
+nw_rows.append('<tr><td>Gesamt</td><td>1</td><td>1</td><td>1</td></tr>')
+write('nw', '1_data.html', page('<div class="group-introduction field-group-div"><div class="field-item even"><p>Einleitung</p><p><strong>x</strong>Aktuelle Fallzahlen. Stand: 31. März 2020, 10:00 Uhr.</p></div></div>'
+                      '<table><thead><tr><th>Landkreis/ kreisfreie Stadt</th><th>Fälle</th><th>Tote</th><th>Inzidenz</th></tr></thead><tbody>{}</tbody></table>'.format(''.join(nw_rows))))
+
+# RP
+rp_rows = ['<tr><td><strong>Landkreis</strong></td><td>Fälle</td><td>Tote</td></tr>']
+county_raw = {'Altenkirchen (Westerwald)': 'Altenkirchen', 'Eifelkreis Bitburg-Prüm': 'Bitburg-Prüm', 'Rhein-Hunsrück-Kreis': 'Rhein-Hunsrück', 'Südliche Weinstraße': 'Südliche Weinstr.'}
+city_raw = {'Frankenthal (Pfalz)': 'Frankenthal', 'Landau in der Pfalz': 'Landau i.d.Pfalz', 'Ludwigshafen am Rhein': 'Ludwigshafen', 'Neustadt an der Weinstraße': 'Neustadt Weinst.'}
+for c in POPULATION['county']['RP']:
+    infected, death = random_counts()
+    rp_rows.append('<tr><td>LK {}</td><td>{}</td><td>{}</td></tr>'.format(county_raw.get(c, c), infected, death or ' '))
+rp_rows.append('<tr><td><strong>Stadt</strong></td><td> </td><td> </td></tr>')
+for c in POPULATION['city']['RP']:
+    infected, death = random_counts()
+    rp_rows.append('<tr><td>KS {}</td><td>{}</td><td>{}</td></tr>'.format(city_raw.get(c, c), infected, death or ' '))
+rp_rows.append('<tr><td>Gesamt</td><td>1</td><td>1</td></tr>')
+write('rp', '1_data.html', page('<div class="text"><p>Fallzahlen nach Landkreisen</p><p>Stand: 31.03.2020\xa0(10:00 Uhr)</p><p><a class="download" href="/fileadmin/tabelle.pdf">PDF</a></p></div>'
+                      '<table><tbody>{}</tbody></table>'.format(''.join(rp_rows))))
+
+# SH
+sh_rows = []
+for n in list(POPULATION['county']['SH']) + list(POPULATION['city']['SH']):
+    infected, death = random_counts()
+    sh_rows.append('<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format(n, infected, infected // 3, death, infected // 2))
+sh_rows.append('<tr><td>SUMME</td><td>1</td><td>1</td><td>1</td><td>1</td></tr>')
+write('sh', '1_data.html', page('<div class="bodyText"><p>Datenstand: 31.03.2020 10:00:00.</p><table class="covid19 kreistabelle"><thead><tr><th>Kreis</th><th>a</th><th>b</th><th>c</th><th>d</th></tr></thead><tbody>{}</tbody></table></div>'.format(''.join(sh_rows))))
+
+# SL
+sl_ps = ''.join('<p>Eintrag Nummer {} ohne Zahlen.</p>'.format(i) for i in range(30))
+write('sl', '1_data.html', page('<main class="main row"><div class="col"><p><strong>31.03.2020 – 14:00 Uhr</strong></p><p>Die Zahl der infizierten Personen beträgt landesweit 1.234 (Stand heute). Zahl der Verstorbenen: 12.</p>{}</div></main>'.format(sl_ps)))
+
+# SN
+sn_rows = []
+names = ['Landkreis ' + c for c in POPULATION['county']['SN']] + ['Stadt Chemnitz', 'Landeshauptstadt Dresden', 'Stadt Leipzig']
+for n in names:
+    infected, death = random_counts()
+    sn_rows.append('<tr><td><span>{}</span></td><td><span>{} (+12)</span></td><td>1</td><td>2</td><td>{}</td><td>4</td></tr>'.format(n, format_number(infected), format_number(death) if death else ' '))
+sn_rows.append('<tr><td><strong>Gesamtzahl der Infektionen</strong></td><td>1</td><td>1</td><td>1</td><td>1</td><td>1</td></tr>')
+write('sn', '1_data.html', page('<div class="text-col"><p>Einleitung</p><p>Fallzahlen (Stand 31.\xa0März 2020, 10:00 Uhr)</p></div>'
+                      '<table><thead><tr><th>Kreisfreie Stadt / Landkreis</th><th>Fälle</th><th>a</th><th>b</th><th>Tote</th><th>c</th></tr></thead><tbody>{}</tbody></table>'.format(''.join(sn_rows))))
+
+# ST
+st_rows = ['<tr><td><p>Melde-Landkreis</p></td><td><p>Fälle</p></td><td><p>x</p></td><td><p>Tote</p></td></tr>']
+names = ['LK ' + ('Anhalt Bitterfeld' if c == 'Anhalt-Bitterfeld' else c) for c in POPULATION['county']['ST']] + ['SK Dessau', 'SK Halle', 'SK Magdeburg']
+for n in names:
+    infected, death = random_counts()
+    st_rows.append('<tr><td><p>{}</p></td><td><p>{}</p></td><td><p>{}</p></td><td><p>{}</p></td></tr>'.format(n, infected, infected // 4, death))
+st_rows.append('<tr><td><p>Gesamtergebnis</p></td><td><p>1</p></td><td><p>1</p></td><td><p>1</p></td></tr>')
+write('st', '2_data.html', page('<div class="news"><p><span>Übersicht (Stand: 31. März 2020, 10:00 Uhr)</span></p><table><tbody>{}</tbody></table></div>'.format(''.join(st_rows))))
+st_posts = ''.join('<div><h2 class="tx-rssdisplay-item-title"><a href="https://ms.sachsen-anhalt.de/presse/pm-{}/">{}</a></h2></div>'.format(
+    i, '1.095 Personen mit Coronavirus infiziert' if i == 1 else 'Ministerin informiert Nummer {}'.format(i)) for i in range(10))
+write('st', '1_search.html', page('<div id="oldpdb">{}</div>'.format(st_posts)))
+
+# TH
+th_rows = []
+for n in list(POPULATION['county']['TH']) + list(POPULATION['city']['TH']):
+    infected, death = random_counts()
+    th_rows.append('<tr><th>{}</th><td>{}</td><td>{}</td><td>1</td><td>2</td><td>3</td><td>4</td><td>5</td><td>{}</td></tr>'.format(n, infected % 7, infected, death or ' '))
+th_rows.append('<tr><th>Summe</th><td>1</td><td>1</td><td>1</td><td>1</td><td>1</td><td>1</td><td>1</td><td>1</td></tr>')
+write('th', '1_data.html', page('<div class="frame frame-default frame-type-text frame-layout-0"><h2>Fallzahlen in Thüringen (Stand: 31. März 2020, 10 Uhr)</h2>'
+                      '<table class="table table-striped"><thead><tr><th>Kreis</th><th>neu</th><th>aktueller</th></tr></thead><tbody>{}</tbody></table></div>'.format(''.join(th_rows))))
@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import os
-import requests
+import common
+import counties
+import dates
+import re
 import sys
-import traceback
-from datetime import datetime
+from common import FetchError
 from lxml import html
+from observations import Batch
+from phrases import Phrases
+from table import Column, Table, own_text
 
 
 DEBUG = False
@@ -16,199 +17,120 @@ DEBUG = False
 STATE = 'Bremen'
 STATE_SHORT = 'HB'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
+XPATHS = common.compile_xpaths({
+    'dt': '//span[@class="article_time"]/text()',
+    'rows': '//table/tr',
+    'header': 'th/text()',
+    'cells': 'td',
+    'posts': '//ul[@class="searchhits"]/li',
+    'post_title': 'a/text()',
+    'post_href': 'a/@href'
+})
+
+TABLE = Table(
+    cells=XPATHS['cells'],
+    label=XPATHS['header'],
+    length=5,
+    infected=Column(1, text=own_text),
+    death=Column(4, text=own_text),
+    header=(XPATHS['header'], 1, 'Bestätigte Fälle insgesamt'),
+    skip=re.compile('Land Bremen$')
+)
+
+# Titles of the search hits that link to the daily report.
+PHRASES = Phrases({
+    'report': ['^Aktueller Stand Corona', '^Update Fallzahlen Corona']
+})
+
+# The data article is recognized by its table header and article date,
+# without parsing it (see common.fetch_article()).
+ARTICLE_MARKER = 'Bestätigte Fälle insgesamt'
+ARTICLE_DATE = re.compile(r'class="article_time">\s*(\d{1,2})\.(\d{1,2})\.(\d{4})')
 
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
 
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+def notify(msg):
+    common.notify(STATE_SHORT, msg)
 
 
-def notify(msg):
-    print(msg)
+class CoronaParser:
+    def __init__(self, html_text):
+        self.tree = html.fromstring(html_text)
 
-    if 'pushover' not in CONFIG:
-        return
+    def _normalize_county(self, county):
+        return counties.resolve(STATE, county)
 
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    def parse(self):
+        dt_text = XPATHS['dt'](self.tree)[0]
+        dt = dates.strptime(dt_text, '%d.%m.%Y').replace(hour=10).strftime('%Y-%m-%dT%H:%M:%SZ')
 
+        rows = XPATHS['rows'](self.tree)
 
-class CoronaParser:
-    def __init__(self, db, html_text):
-        self.db = db
-        self.tree = html.fromstring(html_text)
+        TABLE.check_header(rows[0])
 
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
+        # Counties
+        data = Batch(STATE, STATE_SHORT, dt)
+        for row in TABLE.extract(rows[1:]):
+            data.add(self._normalize_county(row.county), row.infected, row.death)
 
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
+        return dt, data
 
-    def _normalize_county(self, county):
-        county = county.replace('Stadtgemeinde ', '')
 
-        return county
+SEARCH_URL = 'https://www.senatspressestelle.bremen.de/list.php?template=20_pmsuche_treffer_l&query=10_pmalle_q&sv%5Bonline_date%5D%5B0%5D=%3E2020-02-20&sv%5Bfulltext%5D=corona&sv%5Bfulltext2%5D=corona&sm%5Bfulltext%5D=tablescan&sm%5Bfulltext2%5D=tablescan&sort=online_date&order=desc&suche=cor&skip=0&max=10'
 
-    def _calculate_per_population(self, county, infected, per_population):
-        try:
-            population = POPULATION['city'][STATE_SHORT][county]
 
-            return round(infected * per_population / population, 2)
-        except:
-            notify('{} not found in population database.'.format(county))
+def search(fetcher):
+    r = fetcher.get(SEARCH_URL, fingerprint=False)
+    if not r.ok:
+        raise FetchError('ERROR: failed to search overview, status code: {}'.format(r.status_code))
 
-        return None
+    tree = html.fromstring(r.text)
+    urls = []
+    posts = XPATHS['posts'](tree)
+    for post in posts:
+        title = XPATHS['post_title'](post)[0].strip()
 
-    def _calculate_p10k(self, county, infected):
-        return self._calculate_per_population(county, infected, 10000)
+        if PHRASES.scan(title):
+            urls.append('https://www.senatspressestelle.bremen.de/{}'.format(XPATHS['post_href'](post)[0]))
 
-    def _calculate_p100k(self, county, infected):
-        return self._calculate_per_population(county, infected, 100000)
+    if not urls:
+        raise FetchError('ERROR: no matching post found')
 
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
+    return urls
 
-        return round(infected * per_population / population, 2)
 
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
+# Returns the day of the data (as in dt) or None if the page is no data
+# article.
+def article_date(html_text):
+    if ARTICLE_MARKER not in html_text:
+        return None
 
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
+    match = ARTICLE_DATE.search(html_text)
+    if not match:
+        return None
 
-    def parse(self):
-        dt_text = self.tree.xpath('//span[@class="article_time"]/text()')[0]
-        dt = datetime.strptime(dt_text, '%d.%m.%Y').replace(hour=10).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return '{}-{:02d}-{:02d}'.format(match.group(3), int(match.group(2)), int(match.group(1)))
 
-        rows = self.tree.xpath('//table/tr')
 
-        if rows[0].xpath('th/text()')[1] != 'Bestätigte Fälle insgesamt':
-            raise Exception('ERROR: table not found')
+def fetch(fetcher, data_url=None):
+    if not data_url:
+        return common.fetch_article(fetcher, search, article_date)
 
-        # Counties
-        data = []
-        infected_sum = 0
-        death_sum = 0
-        for row in rows[1:]:
-            thcell = row.xpath('th/text()')
-            cells = row.xpath('td')
-
-            if not thcell or not cells:
-                continue
-
-            if thcell[0].strip() == 'Land Bremen':
-                continue
-
-            if len(cells) != 5:
-                raise Exception('ERROR: invalid cells length: {}'.format(len(cells)))
-
-            county = self._normalize_county(thcell[0].strip())
-            infected_str = cells[1].text.split('(')[0].strip()
-            death_str = cells[4].text.split('(')[0].strip()
-
-            infected = int(infected_str)
-            infected_sum += infected
-
-            death = int(death_str)
-            death_sum += death
-
-            data.append({
-                'measurement': 'infected_de_state',
-                'tags': {
-                    'state': STATE,
-                    'county': county
-                },
-                'time': dt,
-                'fields': {
-                    'count': infected,
-                    'p10k': self._calculate_p10k(county, infected),
-                    'p100k': self._calculate_p100k(county, infected),
-                    'death': death
-                }
-            })
-
-        data.append({
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum),
-                'death': death_sum
-            }
-        })
-
-        self._store(data)
-
-        return dt
-
-
-search_url = 'https://www.senatspressestelle.bremen.de/list.php?template=20_pmsuche_treffer_l&query=10_pmalle_q&sv%5Bonline_date%5D%5B0%5D=%3E2020-02-20&sv%5Bfulltext%5D=corona&sv%5Bfulltext2%5D=corona&sm%5Bfulltext%5D=tablescan&sm%5Bfulltext2%5D=tablescan&sort=online_date&order=desc&suche=cor&skip=0&max=10'
-
-if len(sys.argv) == 2:
-    data_url = sys.argv[1]
-else:
-    r = requests.get(search_url, headers={'User-Agent': CONFIG['user_agent']})
+    r = fetcher.get(data_url)
     if not r.ok:
-        print('ERROR: failed to search overview, status code: {}'.format(r.stats_code))
-        sys.exit(1)
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
 
-    tree = html.fromstring(r.text)
-    posts = tree.xpath('//ul[@class="searchhits"]/li')
-    data_url = None
-    for post in posts:
-        title = post.xpath('a/text()')[0].strip()
-        href = post.xpath('a/@href')[0]
-
-        if title.startswith('Aktueller Stand Corona') or title.startswith('Update Fallzahlen Corona'):
-            data_url = 'https://www.senatspressestelle.bremen.de/{}'.format(href)
-            break
-
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to search overview, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, r.text)
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+    return r.text
+
+
+def parse(html_text):
+    corona_parser = CoronaParser(html_text)
+
+    return corona_parser.parse()
+
+
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
+
+
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
@@ -1,15 +1,13 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import locale
-import os
-import requests
+import common
+import counties
+import dates
+import re
 import sys
-import traceback
-from datetime import datetime
-from lxml import html
+from common import FetchError
+from observations import Batch
+from table import Column, Table
 
 
 DEBUG = False
@@ -17,208 +15,79 @@ DEBUG = False
 STATE = 'Hessen'
 STATE_SHORT = 'HE'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
-
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
-
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+XPATHS = common.compile_xpaths({
+    'dt': '//div[@class="he_content_body"]//strong/text()',
+    'table': '//tbody',
+    'rows': 'tr',
+    'cells': 'td',
+    'cell_text': 'p/descendant-or-self::*/text()'
+})
+
+FRAGMENTS = [
+    ('<div class="he_content_body">', '</table>')
+]
+
+# The number of results parse() needs from each XPath in the fragments,
+# otherwise the full page is parsed.
+FRAGMENT_XPATHS = {
+    'dt': 1,
+    'table': 1
+}
+
+TABLE = Table(
+    cells=XPATHS['cells'],
+    length=6,
+    county=Column(0, text=XPATHS['cell_text'], join=True),
+    infected=Column(1, text=XPATHS['cell_text'], skip=re.compile('kumuliert$')),
+    death=Column(2, text=XPATHS['cell_text'], empty=('',)),
+    skip=re.compile('Kreis/|Gesamt$|gesamt$|Gesamtergebnis$')
+)
 
 
 def notify(msg):
-    print(msg)
-
-    if 'pushover' not in CONFIG:
-        return
-
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    common.notify(STATE_SHORT, msg)
 
 
 class CoronaParser:
-    def __init__(self, db, tree):
-        self.db = db
+    def __init__(self, tree):
         self.tree = tree
 
-        locale.setlocale(locale.LC_TIME, "de_DE.utf8")
-
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
-
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-
     def _normalize_county(self, county):
-        if county.startswith('SK '):
-            county = county.replace('SK ', '')
+        return counties.resolve(STATE, county)
 
-            county = county.replace('Frankfurtam Main', 'Frankfurt am Main')
-            county = county.replace('Offenbach', 'Offenbach am Main')
-            county = '{} (Stadt)'.format(county)
-        elif county.startswith('LK '):
-            county = county.replace('LK ', '')
-            county = county.replace('Hochtaunus-kreis', 'Hochtaunuskreis')
-            county = county.replace('Odenwald-kreis', 'Odenwaldkreis')
-            county = county.replace('Vogelsberg-kreis', 'Vogelsbergkreis')
-            county = county.replace('Wetterau-kreis', 'Wetteraukreis')
+    def parse(self):
+        dt_array = XPATHS['dt'](self.tree)[0].split(',', 3)
+        dt_text = ''.join(dt_array[1:3])
+        dt = dates.strptime(dt_text, ' Stand %d. %B %Y %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
 
-        return county
+        table = XPATHS['table'](self.tree)[0]
 
-    def _calculate_per_population(self, county, infected, per_population):
-        try:
-            if county.endswith('(Stadt)'):
-                raw_county = county.replace(' (Stadt)', '')
-                population = POPULATION['city'][STATE_SHORT][raw_county]
-            else:
-                population = POPULATION['county'][STATE_SHORT][county]
+        # Counties
+        data = Batch(STATE, STATE_SHORT, dt)
+        for row in TABLE.extract(XPATHS['rows'](table)):
+            data.add(self._normalize_county(row.county), row.infected, row.death)
 
-            return round(infected * per_population / population, 2)
-        except:
-            notify('{} not found in population database.'.format(county))
+        return dt, data
 
-        return None
 
-    def _calculate_p10k(self, county, infected):
-        return self._calculate_per_population(county, infected, 10000)
+DATA_URL = 'https://soziales.hessen.de/gesundheit/infektionsschutz/coronavirus-sars-cov-2/taegliche-uebersicht-der-bestaetigten-sars-cov-2-faelle-hessen'
 
-    def _calculate_p100k(self, county, infected):
-        return self._calculate_per_population(county, infected, 100000)
 
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
+def fetch(fetcher, data_url=DATA_URL):
+    r = fetcher.get(data_url)
+    if not r.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
 
-        return round(infected * per_population / population, 2)
+    return r.text
 
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
 
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
+def parse(html_text):
+    return common.parse_html(sys.modules[__name__], html_text, lambda tree: CoronaParser(tree).parse())
 
-    def parse(self):
-        dt_array = self.tree.xpath('//div[@class="he_content_body"]//strong/text()')[0].split(',', 3)
-        dt_text = ''.join(dt_array[1:3])
-        dt = datetime.strptime(dt_text, ' Stand %d. %B %Y %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
 
-        table = self.tree.xpath('//tbody')[0]
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
 
-        # Counties
-        data = []
-        infected_sum = 0
-        death_sum = 0
-        for row in table.xpath('tr'):
-            cells = row.xpath('td')
-            cell0_text = ''.join(cells[0].xpath('p/descendant-or-self::*/text()'))
-            cell1_text = cells[1].xpath('p/descendant-or-self::*/text()')[0]
-
-            if not cells:
-                continue
-
-            if cell1_text == 'kumuliert' or \
-                    cell0_text.startswith('Kreis/') or \
-                    cell0_text == 'Gesamt' or \
-                    cell0_text == 'gesamt' or \
-                    cell0_text == 'Gesamtergebnis' or \
-                    cell0_text == '\xa0':
-                continue
-
-            if len(cells) != 6:
-                raise Exception('ERROR: invalid cells length: {}'.format(len(cells)))
-
-            cell2_text = cells[2].xpath('p/descendant-or-self::*/text()')[0]
-
-            county = self._normalize_county(cell0_text.strip())
-            infected_str = cell1_text.strip().replace('.', '')
-            death_str = cell2_text.strip().replace('.', '')
-
-            infected = int(infected_str)
-            infected_sum += infected
-
-            if death_str:
-                death = int(death_str)
-                death_sum += death
-            else:
-                death = 0
-
-            data.append({
-                'measurement': 'infected_de_state',
-                'tags': {
-                    'state': STATE,
-                    'county': county
-                },
-                'time': dt,
-                'fields': {
-                    'count': infected,
-                    'p10k': self._calculate_p10k(county, infected),
-                    'p100k': self._calculate_p100k(county, infected),
-                    'death': death
-                }
-            })
-
-        data.append({
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum),
-                'death': death_sum
-            }
-        })
-
-        self._store(data)
-
-        return dt
-
-
-data_url = 'https://soziales.hessen.de/gesundheit/infektionsschutz/coronavirus-sars-cov-2/taegliche-uebersicht-der-bestaetigten-sars-cov-2-faelle-hessen'
-if len(sys.argv) == 2:
-    data_url = sys.argv[1]
-
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to fetch data, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, html.fromstring(r.text))
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
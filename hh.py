@@ -1,16 +1,11 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import locale
-import os
-import re
-import requests
+import common
+import dates
 import sys
-import traceback
-from datetime import datetime
+from common import FetchError
 from lxml import html
+from observations import Batch
 
 
 DEBUG = False
@@ -18,119 +13,54 @@ DEBUG = False
 STATE = 'Hamburg'
 STATE_SHORT = 'HH'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
+XPATHS = common.compile_xpaths({
+    'dt': '//span[@class="chart_publication"]/text()',
+    'infected': '//div[@class="teaser teaser-thumb col-xs-12 col-md-6 col-xl-4"]/div[@class="c_chart one"]/h2[@class="c_chart_h2"]/text()'
+})
 
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
 
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+def notify(msg):
+    common.notify(STATE_SHORT, msg)
 
 
-def notify(msg):
-    print(msg)
+class CoronaParser:
+    def __init__(self, html_text):
+        self.tree = html.fromstring(html_text)
+
+    def parse(self):
+        dt_text = XPATHS['dt'](self.tree)[0].strip()
+        dt_text = dt_text.replace('Sonnabend', 'Sonntag')
+        dt = dates.strptime(dt_text, 'Stand: %A, %d. %B %Y;').replace(hour=13).strftime('%Y-%m-%dT%H:%M:%SZ')
 
-    if 'pushover' not in CONFIG:
-        return
+        infected_str = XPATHS['infected'](self.tree)[0]
+        infected_sum = int(infected_str)
 
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+        data = Batch(STATE, STATE_SHORT, dt, deaths=False)
+        data.total(infected_sum)
 
+        return dt, data
 
-class CoronaParser:
-    def __init__(self, db, html_text):
-        self.db = db
-        self.tree = html.fromstring(html_text)
 
-        locale.setlocale(locale.LC_TIME, "de_DE.utf8")
+DATA_URL = 'https://www.hamburg.de/coronavirus/'
 
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
 
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
+def fetch(fetcher, data_url=DATA_URL):
+    r = fetcher.get(data_url)
+    if not r.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
 
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
+    return r.text
 
-        return round(infected * per_population / population, 2)
 
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
+def parse(html_text):
+    corona_parser = CoronaParser(html_text)
 
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
+    return corona_parser.parse()
 
-    def parse(self):
-        dt_text = self.tree.xpath('//span[@class="chart_publication"]/text()')[0].strip()
-        dt_text = dt_text.replace('Sonnabend', 'Sonntag')
-        dt = datetime.strptime(dt_text, 'Stand: %A, %d. %B %Y;').replace(hour=13).strftime('%Y-%m-%dT%H:%M:%SZ')
 
-        infected_str = self.tree.xpath('//div[@class="teaser teaser-thumb col-xs-12 col-md-6 col-xl-4"]/div[@class="c_chart one"]/h2[@class="c_chart_h2"]/text()')[0]
-        infected_sum = int(infected_str)
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
+
 
-        data = [{
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum)
-            }
-        }]
-
-        self._store(data)
-
-        return dt
-
-
-data_url = 'https://www.hamburg.de/coronavirus/'
-if len(sys.argv) == 2:
-    data_url = sys.argv[1]
-
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to search overview, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, r.text)
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
@@ -1,15 +1,14 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import os
+import common
+import counties
+import dates
 import re
-import requests
 import sys
-import traceback
-from datetime import datetime
+from common import FetchError
 from lxml import html
+from observations import Batch
+from table import Column, Table
 
 
 DEBUG = False
@@ -17,94 +16,44 @@ DEBUG = False
 STATE = 'Mecklenburg-Vorpommern'
 STATE_SHORT = 'MV'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
-
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
-
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+XPATHS = common.compile_xpaths({
+    'rows': '//table/tr',
+    'dt': 'td/p/strong/text()',
+    'cells': 'td',
+    'cell_text': 'p//text()',
+    'cell_paragraph_text': 'p/text()',
+    'post_href': '//div[@class="resultlist"]/div[contains(@class, "teaser")]//a/@href'
+})
+
+TABLE = Table(
+    cells=XPATHS['cells'],
+    length=4,
+    min_length=2,
+    county=Column(0, text=XPATHS['cell_text']),
+    infected=Column(2, text=XPATHS['cell_paragraph_text']),
+    skip=re.compile('Corona-positiv|Kreis/|Summe$')
+)
+
+# The data article is recognized by the date in its table header, without
+# parsing it (see common.fetch_article()).
+ARTICLE_DATE = re.compile(r'<strong>[^<]*Stand (\d{1,2})\.(\d{1,2})\.')
 
 
 def notify(msg):
-    print(msg)
-
-    if 'pushover' not in CONFIG:
-        return
-
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    common.notify(STATE_SHORT, msg)
 
 
 class CoronaParser:
-    def __init__(self, db, html_text):
-        self.db = db
+    def __init__(self, html_text):
         self.tree = html.fromstring(html_text)
 
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
-
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-
     def _normalize_county(self, county):
-        county = county.replace('Schwerin', 'Schwerin (Stadt)')
-        county = county.replace('Hansestadt Rostock', 'Rostock (Stadt)')
-        county = county.replace('Landkreis Rostock', 'Rostock')
-
-        return county
-
-    def _calculate_per_population(self, county, infected, per_population):
-        try:
-            if county.endswith('(Stadt)'):
-                raw_county = county.replace(' (Stadt)', '')
-                population = POPULATION['city'][STATE_SHORT][raw_county]
-            else:
-                population = POPULATION['county'][STATE_SHORT][county]
-
-            return round(infected * per_population / population, 2)
-        except:
-            notify('{} not found in population database.'.format(county))
-
-        return None
-
-    def _calculate_p10k(self, county, infected):
-        return self._calculate_per_population(county, infected, 10000)
-
-    def _calculate_p100k(self, county, infected):
-        return self._calculate_per_population(county, infected, 100000)
-
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
-
-        return round(infected * per_population / population, 2)
-
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
-
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
+        return counties.resolve(STATE, county)
 
     def parse(self):
-        rows = self.tree.xpath('//table/tr')
+        rows = XPATHS['rows'](self.tree)
 
-        dt_paragraph = ' '.join(rows[1].xpath('td/p/strong/text()'))
+        dt_paragraph = ' '.join(XPATHS['dt'](rows[1]))
         result = re.findall(r'(Stand .+)', dt_paragraph)
         if not result:
             raise ValueError('ERROR: CoronaParser: dt text not found')
@@ -112,109 +61,67 @@ class CoronaParser:
         dt_text = result[0].strip()
 
         try:
-            dt = datetime.strptime(dt_text, 'Stand %d.%m. %H:%M Uhr').replace(year=2020).strftime('%Y-%m-%dT%H:%M:%SZ')
+            dt = dates.strptime(dt_text, 'Stand %d.%m. %H:%M Uhr').replace(year=2020).strftime('%Y-%m-%dT%H:%M:%SZ')
         except ValueError:
             try:
-                dt = datetime.strptime(dt_text, 'Stand %d.%m. %H:%M').replace(year=2020).strftime('%Y-%m-%dT%H:%M:%SZ')
+                dt = dates.strptime(dt_text, 'Stand %d.%m. %H:%M').replace(year=2020).strftime('%Y-%m-%dT%H:%M:%SZ')
             except ValueError:
-                dt = datetime.strptime(dt_text, 'Stand %d.%m. %H Uhr').replace(year=2020).strftime('%Y-%m-%dT%H:%M:%SZ')
+                dt = dates.strptime(dt_text, 'Stand %d.%m. %H Uhr').replace(year=2020).strftime('%Y-%m-%dT%H:%M:%SZ')
 
         # Counties
-        data = []
-        infected_sum = 0
-        for row in rows:
-            cells = row.xpath('td')
-
-            if not cells:
-                continue
-
-            if len(cells) == 1:
-                continue
-
-            cell0_text = cells[0].xpath('p//text()')[0].strip()
-
-            if not cell0_text or cell0_text.startswith('Corona-positiv') or cell0_text.startswith('Kreis/') or cell0_text == 'Summe':
-                continue
-
-            if len(cells) != 4:
-                raise Exception('ERROR: invalid cells length: {}'.format(len(cells)))
-
-            county = self._normalize_county(cell0_text.strip())
-            infected_str = cells[2].xpath('p/text()')[0].strip()
-
-            infected = int(infected_str)
-            infected_sum += infected
-
-            data.append({
-                'measurement': 'infected_de_state',
-                'tags': {
-                    'state': STATE,
-                    'county': county
-                },
-                'time': dt,
-                'fields': {
-                    'count': infected,
-                    'p10k': self._calculate_p10k(county, infected),
-                    'p100k': self._calculate_p100k(county, infected)
-                }
-            })
-
-        data.append({
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum)
-            }
-        })
-
-        self._store(data)
-
-        return dt
-
-
-search_url = 'https://www.regierung-mv.de/Landesregierung/wm/Aktuell/?sa.query=Aktueller+Stand+Corona-Infektionen&sa.pressemitteilungen.area=11&sa.month=alle&sa.year=alle&search_filter_submit='
-
-if len(sys.argv) == 2:
-    data_url = sys.argv[1]
-else:
-    r = requests.get(search_url, headers={'User-Agent': CONFIG['user_agent']})
+        data = Batch(STATE, STATE_SHORT, dt, deaths=False)
+        for row in TABLE.extract(rows):
+            data.add(self._normalize_county(row.county), row.infected)
+
+        return dt, data
+
+
+SEARCH_URL = 'https://www.regierung-mv.de/Landesregierung/wm/Aktuell/?sa.query=Aktueller+Stand+Corona-Infektionen&sa.pressemitteilungen.area=11&sa.month=alle&sa.year=alle&search_filter_submit='
+
+
+def search(fetcher):
+    r = fetcher.get(SEARCH_URL, fingerprint=False)
     if not r.ok:
-        print('ERROR: failed to search overview, status code: {}'.format(r.stats_code))
-        sys.exit(1)
+        raise FetchError('ERROR: failed to search overview, status code: {}'.format(r.status_code))
 
     tree = html.fromstring(r.text)
-    path = tree.xpath('//div[@class="resultlist"]/div[contains(@class, "teaser")]//a/@href')[0]
-    data_url = 'https://www.regierung-mv.de{}'.format(path)
-
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to search overview, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, r.text)
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+    urls = ['https://www.regierung-mv.de{}'.format(path) for path in XPATHS['post_href'](tree)]
+    if not urls:
+        raise FetchError('ERROR: no matching post found')
+
+    return urls
+
+
+# Returns the day of the data (as in dt) or None if the page is no data
+# article.
+def article_date(html_text):
+    match = ARTICLE_DATE.search(html_text)
+    if not match:
+        return None
+
+    return '2020-{:02d}-{:02d}'.format(int(match.group(2)), int(match.group(1)))
+
+
+def fetch(fetcher, data_url=None):
+    if not data_url:
+        return common.fetch_article(fetcher, search, article_date)
+
+    r = fetcher.get(data_url)
+    if not r.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
+
+    return r.text
+
+
+def parse(html_text):
+    corona_parser = CoronaParser(html_text)
+
+    return corona_parser.parse()
+
+
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
+
+
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
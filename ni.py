@@ -1,15 +1,14 @@
 #!/usr/bin/env python3
 
 import csv
-import influxdb
+import common
+import counties
+import dates
 import io
-import json
-import os
-import requests
 import sys
-import traceback
-from datetime import datetime
+from common import FetchError
 from lxml import html
+from observations import Batch
 
 
 DEBUG = False
@@ -17,187 +16,83 @@ DEBUG = False
 STATE = 'Niedersachsen'
 STATE_SHORT = 'NI'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
+XPATHS = common.compile_xpaths({
+    'dt': '//p/b/text()'
+})
 
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
-
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+# Columns of the NLGA csv that are read, everything else is skipped.
+COLUMNS = ['Landkreis', 'bestätigte Fälle', 'verstorbene Fälle']
 
 
 def notify(msg):
-    print(msg)
+    common.notify(STATE_SHORT, msg)
+
+
+# Reads the csv straight off the downloaded bytes through an incremental
+# decoder and yields (county, infected, death) per row, without building the
+# decoded text, its lines or a dict per row.
+def read_rows(csv_content):
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(csv_content), encoding='utf-8', newline=''), delimiter=';')
 
-    if 'pushover' not in CONFIG:
-        return
+    header = next(reader, [])
+    for column in COLUMNS:
+        if column not in header:
+            raise Exception('ERROR: csv column not found: {}'.format(column))
+    county_index, infected_index, death_index = [header.index(column) for column in COLUMNS]
 
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    for row in reader:
+        if not row:
+            continue
+
+        yield row[county_index].strip(), int(row[infected_index]), int(row[death_index])
 
 
 class CoronaParser:
-    def __init__(self, db, html_text, csv_content):
-        self.db = db
+    def __init__(self, html_text, csv_content):
         self.tree = html.fromstring(html_text)
-        self.data = list(csv.DictReader(csv_content.decode('utf-8').splitlines(), delimiter=';'))
+        self.rows = read_rows(csv_content)
 
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
+    def _normalize_county(self, county):
+        return counties.resolve(STATE, county)
 
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
+    def parse(self):
+        dt_text = XPATHS['dt'](self.tree)[6]
+        dt = dates.strptime(dt_text, 'Datenstand: %d.%m.%Y %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
 
-    def _normalize_county(self, county):
-        county = county.replace('Nienburg (Weser)', 'Nienburg/Weser')
-        county = county.replace('LK ', '')
+        # Counties
+        data = Batch(STATE, STATE_SHORT, dt, strict=True)
+        for raw_county, infected, death in self.rows:
+            data.add(self._normalize_county(raw_county), infected, death)
 
-        if county.startswith('SK '):
-            county = county.replace('SK ', '')
-            county = '{} (Stadt)'.format(county)
+        return dt, data
 
-        return county
 
-    def _calculate_per_population(self, county, infected, per_population):
-        try:
-            if county == 'Region Hannover':
-                population = POPULATION['city'][STATE_SHORT]['Hannover']
-                population += POPULATION['county'][STATE_SHORT]['Hannover']
-            elif county.endswith('(Stadt)'):
-                raw_county = county.replace(' (Stadt)', '')
-                population = POPULATION['city'][STATE_SHORT][raw_county]
-            else:
-                population = POPULATION['county'][STATE_SHORT][county]
+DATA_URL = 'https://www.apps.nlga.niedersachsen.de/corona/iframe.php'
+CSV_URL = 'https://www.apps.nlga.niedersachsen.de/corona/download.php?csv-file'
 
-            return round(infected * per_population / population, 2)
-        except:
-            raise Exception('{} not found in population database.'.format(county))
 
-        return None
+def fetch(fetcher, data_url=DATA_URL, csv_url=CSV_URL):
+    r_web = fetcher.get(data_url)
+    if not r_web.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r_web.status_code))
 
-    def _calculate_p10k(self, county, infected):
-        return self._calculate_per_population(county, infected, 10000)
+    r_csv = fetcher.get(csv_url)
+    if not r_csv.ok:
+        raise FetchError('ERROR: failed to fetch csv, status code: {}'.format(r_csv.status_code))
 
-    def _calculate_p100k(self, county, infected):
-        return self._calculate_per_population(county, infected, 100000)
+    return r_web.text, r_csv.content
 
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
 
-        return round(infected * per_population / population, 2)
+def parse(payload):
+    html_text, csv_content = payload
+    corona_parser = CoronaParser(html_text, csv_content)
 
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
+    return corona_parser.parse()
 
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
 
-    def parse(self):
-        dt_text = self.tree.xpath('//p/b/text()')[6]
-        dt = datetime.strptime(dt_text, 'Datenstand: %d.%m.%Y %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
 
-        # Counties
-        data = []
-        infected_sum = 0
-        death_sum = 0
-        for row in self.data:
-            county = self._normalize_county(row['Landkreis'].strip())
-            infected_str = row['bestätigte Fälle'].strip()
-            death_str = row['verstorbene Fälle'].strip()
-
-            infected = int(infected_str)
-            infected_sum += infected
-
-            death = int(death_str)
-            death_sum += death
-
-            data.append({
-                'measurement': 'infected_de_state',
-                'tags': {
-                    'state': STATE,
-                    'county': county
-                },
-                'time': dt,
-                'fields': {
-                    'count': infected,
-                    'p10k': self._calculate_p10k(county, infected),
-                    'p100k': self._calculate_p100k(county, infected),
-                    'death': death
-                }
-            })
-
-        data.append({
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum),
-                'death': death_sum
-            }
-        })
-
-        self._store(data)
-
-        return dt
-
-
-data_url = 'https://www.apps.nlga.niedersachsen.de/corona/iframe.php'
-if len(sys.argv) == 3:
-    data_url = sys.argv[1]
-
-r_web = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r_web.ok:
-    print('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
-    sys.exit(1)
-
-csv_url = 'https://www.apps.nlga.niedersachsen.de/corona/download.php?csv-file'
-if len(sys.argv) == 3:
-    csv_url = sys.argv[2]
-
-r_csv = requests.get(csv_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r_csv.ok:
-    print('ERROR: failed to fetch csv, status code: {}'.format(r_csv.status_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, r_web.text, r_csv.content)
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
@@ -0,0 +1,192 @@
+import common
+from array import array
+from datetime import date, timedelta
+
+
+INCIDENCE_DAYS = 7
+
+
+# Advances the rolling state of one series (county or state total) by a
+# point. history holds [day, count, death] of the last reported days, as far
+# back as the newest day at least INCIDENCE_DAYS before. Returns the new
+# history with new_cases, new_deaths (since the previous reported day) and the
+# cases within INCIDENCE_DAYS, or None for a point older than the history. A
+# second point on the same day replaces the first, so writing a run again
+# yields the same values.
+def advance(history, day, count, death):
+    if history and day < history[-1][0]:
+        return None
+
+    if history and history[-1][0] == day:
+        history = history[:-1]
+
+    new_cases = None
+    new_deaths = None
+    if history:
+        new_cases = count - history[-1][1]
+        if death is not None and history[-1][2] is not None:
+            new_deaths = death - history[-1][2]
+
+    history = history + [[day, count, death]]
+
+    cutoff = (date.fromisoformat(day) - timedelta(days=INCIDENCE_DAYS)).isoformat()
+    start = 0
+    while start + 1 < len(history) and history[start + 1][0] <= cutoff:
+        start += 1
+    history = history[start:]
+
+    cases = count - history[0][1] if history[0][0] <= cutoff else None
+
+    return history, new_cases, new_deaths, cases
+
+
+# The observations of one state run. Counties, counts and deaths are kept in
+# parallel arrays, the state total is their sum unless the source reports it
+# separately (total()). p10k and p100k are computed for the whole batch in one
+# pass over the populations valid at the batch's time, and the points for the
+# database are only built when the batch is written (iterating it yields the
+# points). A batch also crosses the process boundary from the parse workers
+# much smaller than its points would. derived() adds the daily new cases and
+# deaths and the 7-day incidence from the rolling state of each series.
+class Batch:
+    __slots__ = ['state', 'state_short', 'time', 'counties', 'counts', 'deaths', 'total_count', 'total_death', 'strict']
+
+    # deaths: the source reports deaths per county. strict: a county without
+    # population fails the batch instead of getting no p10k/p100k.
+    def __init__(self, state, state_short, time, deaths=True, strict=False):
+        self.state = state
+        self.state_short = state_short
+        self.time = time
+        self.counties = []
+        self.counts = array('q')
+        self.deaths = array('q') if deaths else None
+        self.total_count = None
+        self.total_death = None
+        self.strict = strict
+
+    def add(self, county, count, death=None):
+        self.counties.append(county)
+        self.counts.append(count)
+        if self.deaths is not None:
+            self.deaths.append(death)
+
+    def total(self, count, death=None):
+        self.total_count = count
+        self.total_death = death
+
+    def __len__(self):
+        return len(self.counties) + 1
+
+    def __iter__(self):
+        return iter(self.points())
+
+    def _populations(self):
+        store = common.population()
+
+        populations = [store.county(self.state_short, county, self.time) for county in self.counties]
+        for county, population in zip(self.counties, populations):
+            if population is None:
+                if self.strict:
+                    raise Exception('{} not found in population database.'.format(county))
+
+                common.report_missing_population(self.state_short, county)
+
+        return populations
+
+    def per_population(self):
+        p10k = []
+        p100k = []
+        for count, population in zip(self.counts, self._populations()):
+            if population:
+                p10k.append(round(count * 10000 / population, 2))
+                p100k.append(round(count * 100000 / population, 2))
+            else:
+                p10k.append(None)
+                p100k.append(None)
+
+        return p10k, p100k
+
+    # Returns the derived fields of every county and the state total (in point
+    # order) and the advanced histories by series key, for series.update()
+    # once the points are written.
+    def derived(self, series):
+        day = self.time[:10]
+
+        total_count, total_death = self._total()
+
+        keys = ['{}/{}'.format(self.state_short, county) for county in self.counties] + [self.state_short]
+        counts = list(self.counts) + [total_count]
+        deaths = (list(self.deaths) if self.deaths is not None else [None] * len(self.counties)) + [total_death]
+        populations = self._populations() + [common.population().state(self.state_short, self.time)]
+
+        derived = []
+        histories = {}
+        for key, count, death, population in zip(keys, counts, deaths, populations):
+            advanced = advance(series.history(key), day, count, death)
+            if advanced is None:
+                derived.append({})
+                continue
+
+            history, new_cases, new_deaths, cases = advanced
+            histories[key] = history
+
+            fields = {}
+            if new_cases is not None:
+                fields['new_cases'] = new_cases
+            if new_deaths is not None:
+                fields['new_deaths'] = new_deaths
+            if cases is not None and population:
+                fields['incidence_7d_p100k'] = round(cases * 100000 / population, 2)
+            derived.append(fields)
+
+        return derived, histories
+
+    def _total(self):
+        if self.total_count is not None:
+            return self.total_count, self.total_death
+
+        return sum(self.counts), sum(self.deaths) if self.deaths is not None else None
+
+    def _point(self, measurement, tags, count, p10k, p100k, death, derived):
+        fields = {
+            'count': count,
+            'p10k': p10k,
+            'p100k': p100k
+        }
+        if death is not None:
+            fields['death'] = death
+        fields.update(derived)
+
+        return {
+            'measurement': measurement,
+            'tags': tags,
+            'time': self.time,
+            'fields': fields
+        }
+
+    # derived: the result of derived(), without it the points only carry the
+    # cumulative fields.
+    def points(self, derived=None):
+        p10k, p100k = self.per_population()
+        deaths = self.deaths if self.deaths is not None else [None] * len(self.counties)
+        if derived is None:
+            derived = [{}] * len(self)
+
+        points = []
+        for county, count, death, county_p10k, county_p100k, county_derived in zip(self.counties, self.counts, deaths, p10k, p100k, derived):
+            points.append(self._point('infected_de_state', {'state': self.state, 'county': county}, count, county_p10k, county_p100k, death, county_derived))
+
+        total_count, total_death = self._total()
+
+        population = common.population().state(self.state_short, self.time)
+        points.append(self._point(
+            'infected_de',
+            {'state': self.state},
+            total_count,
+            round(total_count * 10000 / population, 2),
+            round(total_count * 100000 / population, 2),
+            total_death,
+            derived[-1]
+        ))
+
+        return points
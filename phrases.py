@@ -0,0 +1,57 @@
+import re
+
+
+NUMBER = r'\d[\d\.]*'
+
+
+# Finds numbers in press release texts. patterns maps a field to one or more
+# regular expressions, {} in a pattern marks the number to read, a pattern
+# without {} only marks the field as present (True). All patterns are compiled
+# into a single alternation, so a text is scanned once for all fields and the
+# scan ends as soon as every field was found. As with re.findall()[0], the
+# first match of a field wins.
+class Phrases:
+    def __init__(self, patterns):
+        self.fields = []
+
+        alternatives = []
+        for field, field_patterns in patterns.items():
+            if isinstance(field_patterns, str):
+                field_patterns = [field_patterns]
+
+            for pattern in field_patterns:
+                index = len(self.fields)
+                self.fields.append((field, '{}' in pattern))
+                pattern = pattern.replace('{}', '(?P<n{}>{})'.format(index, NUMBER))
+                alternatives.append('(?P<p{}>{})'.format(index, pattern))
+
+        self.count = len(patterns)
+        self.regex = re.compile('|'.join(alternatives))
+
+    def scan(self, text):
+        values = {}
+        for match in self.regex.finditer(text):
+            index = int(match.lastgroup[1:])
+            field, has_number = self.fields[index]
+            if field in values:
+                continue
+
+            if has_number:
+                values[field] = int(match.group('n{}'.format(index)).replace('.', ''))
+            else:
+                values[field] = True
+
+            if len(values) == self.count:
+                break
+
+        return values
+
+    # Scans texts (e.g. the titles of a press release list, newest first) until
+    # one contains all required fields and returns its index and values.
+    def first(self, texts, required):
+        for index, text in enumerate(texts):
+            values = self.scan(text)
+            if all(field in values for field in required):
+                return index, values
+
+        return None, {}
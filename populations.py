@@ -0,0 +1,147 @@
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+
+
+MAGIC = b'POP2'
+
+# magic, checksum of the sources, number of entries, number of hash slots,
+# number of versions
+HEADER = struct.Struct('<4s32sIII')
+
+
+# Versions are identified by their reference date as a yyyymmdd number. Takes
+# a point's time ('2020-04-01T10:00:00Z' as the scrapers and InfluxDB write
+# it) or a date.
+def day_number(when):
+    if not isinstance(when, str):
+        when = when.isoformat()
+
+    return int(when[:10].replace('-', ''))
+
+
+# Binary population store written by transform.py. After the header follow
+# the reference dates of the versions (int32 yyyymmdd, ascending), the hash
+# slots (int32 entry index, -1 if empty), the key offsets (uint32, one more
+# than entries), the populations (int32, one row of all versions per entry,
+# -1 if the entry has no population in a version) and the utf-8 keys. A key is
+# the state short for the state total and '<state short>/<county>' for the
+# county names as the scrapers write them. The file is mapped read-only, so
+# nothing is parsed on load and all processes share its pages.
+class PopulationStore:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.checksum, self.count, self.slot_count, self.version_count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise Exception('ERROR: {} is not a population store'.format(path))
+
+        self.versions = list(struct.unpack_from('<{}i'.format(self.version_count), self.buffer, HEADER.size))
+
+        self.slots_offset = HEADER.size + 4 * self.version_count
+        self.offsets_offset = self.slots_offset + 4 * self.slot_count
+        self.populations_offset = self.offsets_offset + 4 * (self.count + 1)
+        self.keys_offset = self.populations_offset + 4 * self.count * self.version_count
+
+        # Lookups are repeated on every run, the mapped file stays the source.
+        self.cache = {}
+
+    # The newest version whose reference date is not after when. Points older
+    # than the first version use the first one, without when the newest one
+    # is used.
+    def version(self, when=None):
+        if when is None:
+            return self.version_count - 1
+
+        return max(bisect.bisect_right(self.versions, day_number(when)) - 1, 0)
+
+    def _find(self, key, version):
+        data = key.encode('utf-8')
+        slot = zlib.crc32(data) % self.slot_count
+
+        while True:
+            index, = struct.unpack_from('<i', self.buffer, self.slots_offset + 4 * slot)
+            if index < 0:
+                return None
+
+            start, end = struct.unpack_from('<II', self.buffer, self.offsets_offset + 4 * index)
+            if self.buffer[self.keys_offset + start:self.keys_offset + end] == data:
+                population, = struct.unpack_from('<i', self.buffer, self.populations_offset + 4 * (index * self.version_count + version))
+                return population if population >= 0 else None
+
+            slot = (slot + 1) % self.slot_count
+
+    def get(self, key, when=None):
+        version = self.version(when)
+        try:
+            return self.cache[key, version]
+        except KeyError:
+            population = self.cache[key, version] = self._find(key, version)
+            return population
+
+    def state(self, state_short, when=None):
+        return self.get(state_short, when)
+
+    def county(self, state_short, county, when=None):
+        return self.get('{}/{}'.format(state_short, county), when)
+
+
+def checksum(paths, extra=b''):
+    digest = hashlib.sha256(extra)
+    for path in paths:
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+
+    return digest.digest()
+
+
+def read_checksum(path):
+    try:
+        with open(path, 'rb') as file:
+            magic, digest, _, _, _ = HEADER.unpack(file.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return None
+
+    return digest if magic == MAGIC else None
+
+
+# Writes versions ({reference date: {key: population}}) with open addressing
+# at a load factor of at most 0.5, so a lookup rarely probes more than one
+# slot.
+def write(path, digest, versions):
+    dates = sorted(versions)
+    keys = sorted(set().union(*versions.values()))
+
+    slot_count = 1
+    while slot_count < 2 * len(keys):
+        slot_count *= 2
+
+    slots = [-1] * slot_count
+    offsets = [0]
+    populations = []
+    key_data = bytearray()
+    for index, key in enumerate(keys):
+        data = key.encode('utf-8')
+
+        slot = zlib.crc32(data) % slot_count
+        while slots[slot] >= 0:
+            slot = (slot + 1) % slot_count
+        slots[slot] = index
+
+        key_data += data
+        offsets.append(len(key_data))
+        populations.extend(versions[date].get(key, -1) for date in dates)
+
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, digest, len(keys), slot_count, len(dates)))
+        file.write(struct.pack('<{}i'.format(len(dates)), *[day_number(date) for date in dates]))
+        file.write(struct.pack('<{}i'.format(slot_count), *slots))
+        file.write(struct.pack('<{}I'.format(len(offsets)), *offsets))
+        file.write(struct.pack('<{}i'.format(len(populations)), *populations))
+        file.write(key_data)
+    os.replace(tmp_path, path)
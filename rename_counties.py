@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 
+import counties
 import influxdb
 import json
 import os
-import sys
 
 BASE_PATH = os.path.dirname(os.path.realpath(__file__))
 CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
@@ -19,123 +19,15 @@ db = influxdb.InfluxDBClient(
 )
 db.switch_database(CONFIG['db']['database'])
 
+# Applies the aliases of the live scrapers, so stored raw names end up as
+# the names the scrapers write today.
 def normalize_name(state, county):
-    if state == 'Brandenburg':
-        county = county.replace('Brandenburg a. d. Havel', 'Brandenburg an der Havel')
-
-        return county
-
-    if state == 'Baden-Württemberg':
-        county = county.replace('Stuttgart', 'Stuttgart (Stadt)')
-        county = county.replace(' (Stadtkreis)', ' (Stadt)')
-
-        return county
-
-    if state == 'Bayern':
-        county = county.replace('Bad Tölz', 'Bad Tölz-Wolfratshausen')
-        county = county.replace('Dillingen a.d. Donau', 'Dillingen an der Donau')
-        county = county.replace('Mühldorf a.Inn', 'Mühldorf am Inn')
-        county = county.replace('Neumarkt i.d.Opf.', 'Neumarkt in der Oberpfalz')
-        county = county.replace('Neustadt a.d. Aisch-Bad Windsheim', 'Neustadt an der Aisch-Bad Windsheim')
-        county = county.replace('Neustadt a.d. Waldnaab', 'Neustadt an der Waldnaab')
-        county = county.replace('Pfaffenhofen a.d.Ilm', 'Pfaffenhofen an der Ilm')
-        county = county.replace('Wunsiedel i.Fichtelgebirge', 'Wunsiedel im Fichtelgebirge')
-
-        county = county.replace(' Stadt', ' (Stadt)')
-        county = county.replace('Weiden (Stadt)', 'Weiden in der Oberpfalz (Stadt)')
-
-        return county
-
-    if state == 'Bremen':
-        county = county.replace('Stadtgemeinde ', '')
-
-        return county
-
-    if state == 'Hessen':
-        county = county.replace('LK ', '')
-
-        county = county.replace('SK Offenbach', 'Offenbach am Main (Stadt)')
-        if county.startswith('SK '):
-            county = county.replace('SK ', '')
-            county = '{} (Stadt)'.format(county)
-
-        return county
-
-    if state == 'Mecklenburg-Vorpommern':
-        county = county.replace('Schwerin', 'Schwerin (Stadt)')
-        county = county.replace('Hansestadt Rostock', 'Rostock (Stadt)')
-        county = county.replace('Landkreis Rostock', 'Rostock')
-
-        return county
-
-    if state == 'Niedersachsen':
-        county = county.replace('Nienburg (Weser)', 'Nienburg/Weser')
-        county = county.replace('LK ', '')
-
-        if county.startswith('SK '):
-            county = county.replace('SK ', '')
-            county = '{} (Stadt)'.format(county)
-
-        return county
-
-    if state == 'Nordrhein-Westfalen':
-        if 'Kreis' in county:
-            county = county.replace(' (Kreis)', '')
-        elif county != 'Aachen & Städteregion Aachen':
-            county = county.replace('Mülheim / Ruhr', 'Mülheim an der Ruhr')
-            county = '{} (Stadt)'.format(county)
-
-        return county
-
-    if state == 'Rheinland-Pfalz':
-        county = county.replace('Altenkirchen', 'Altenkirchen (Westerwald)')
-        county = county.replace('Bitburg-Prüm', 'Eifelkreis Bitburg-Prüm')
-        county = county.replace('Rhein-Hunsrück', 'Rhein-Hunsrück-Kreis')
-        county = county.replace('Südliche Weinstr.', 'Südliche Weinstraße')
-
-        county = county.replace('Frankenthal', 'Frankenthal (Pfalz) (Stadt)')
-        county = county.replace('Kaiserslautern', 'Kaiserslautern (Stadt)')
-        county = county.replace('Koblenz', 'Koblenz (Stadt)')
-        county = county.replace('Landau i.d.Pfalz', 'Landau in der Pfalz (Stadt)')
-        county = county.replace('Ludwigshafen', 'Ludwigshafen am Rhein (Stadt)')
-        county = county.replace('Mainz', 'Mainz (Stadt)')
-        county = county.replace('Neustadt Weinst.', 'Neustadt an der Weinstraße (Stadt)')
-        county = county.replace('Pirmasens', 'Pirmasens (Stadt)')
-        county = county.replace('Speyer', 'Speyer (Stadt)')
-        county = county.replace('Trier', 'Trier (Stadt)')
-        county = county.replace('Worms', 'Worms (Stadt)')
-        county = county.replace('Zweibrücken', 'Zweibrücken (Stadt)')
-
-        return county
-
-    if state == 'Sachsen':
-        county = county.replace('Landkreis ', '')
-
-        if county.startswith('Landeshauptstadt ') or county.startswith('Stadt '):
-            county = county.replace('Landeshauptstadt ', '')
-            county = county.replace('Stadt ', '')
-            county = '{} (Stadt)'.format(county)
-
-        return county
-
-    if state == 'Sachsen-Anhalt':
-        county = county.replace('Anhalt Bitterfeld', 'Anhalt-Bitterfeld')
-        county = county.replace('LK ', '')
-
-        if county.startswith('SK '):
-            county = county.replace('Dessau', 'Dessau-Roßlau')
-            county = county.replace('Halle', 'Halle (Saale)')
-            county = county.replace('SK ', '')
-            county = '{} (Stadt)'.format(county)
-
-        return county
-
-    return county
+    return counties.resolve(state, county)
 
 tags_result = db.query('SHOW TAG VALUES ON "corona" FROM "infected_de_state" WITH KEY = "county"').items()[0][1]
-counties = [tag['value'] for tag in tags_result]
+county_names = [tag['value'] for tag in tags_result]
 
-for old_county in counties:
+for old_county in county_names:
     print('Start {} -> '.format(old_county), end='')
 
     result = db.query("""SELECT * FROM "infected_de_state" WHERE county = '{}'""".format(old_county)).items()[0][1]
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+import importlib
+import os
+import sys
+import threading
+import time
+from collect import STATES, parse_workers
+from common import RecordedFetcher, SeriesStore, archive, config, create_db_client, create_parse_pool, parse_state, prefetch_candidates, store
+from collections import deque
+from datetime import datetime
+
+
+BATCH_SIZE = config().get('replay', {}).get('batch_size', 10000)
+
+# Seconds between the archived bodies of one run, e.g. the BW page and its xlsx.
+RUN_WINDOW = config().get('replay', {}).get('run_window', 60)
+
+# Snapshots waiting for the parse pool, so only a few bodies are held at once.
+MAX_PENDING = 2 * (parse_workers() or os.cpu_count() or 1)
+
+
+# Stands in for common.Fetcher and answers every request with the body that was
+# archived last for that url at or before the given fetch time. Re-running a
+# state's fetch() against it rebuilds the payload of that time, including the
+# hop from a search page to the article it pointed at. Article candidates only
+# count for the snapshot once accepted.
+class ArchiveFetcher(RecordedFetcher):
+    def __init__(self, state_short, time, index):
+        self.state_short = state_short
+        self.time = time
+        self.index = index
+        self.hashes = []
+        self.candidate_hashes = {}
+        # As many candidates as the live runs fetched.
+        self.candidates = prefetch_candidates()
+
+    def get(self, url, fingerprint=True, conditional=True):
+        import requests
+
+        r = requests.models.Response()
+        r.url = url
+
+        entry = None
+        for candidate in self.index.get(url, []):
+            if candidate['time'] > self.time:
+                break
+            entry = candidate
+
+        if not entry:
+            r.status_code = 404
+            r._content = b''
+            return r
+
+        # Only the bodies a live fetch would fingerprint make up the payload;
+        # search pages are fetched with fingerprint=False.
+        if not conditional:
+            self.candidate_hashes[url] = entry['hash']
+        elif fingerprint:
+            self.hashes.append(entry['hash'])
+
+        r.status_code = 200
+        r._content = archive().read(entry['hash'])
+        r.encoding = entry['encoding'] or None
+
+        return r
+
+    def accept(self, url, r):
+        self.hashes.append(self.candidate_hashes[url])
+
+
+# The rolling state for the derived fields of a replay. It starts empty and is
+# never saved, so replaying history does not touch the live state.
+class ReplaySeries(SeriesStore):
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def save(self):
+        pass
+
+
+def _seconds(time):
+    return datetime.strptime(time, '%Y-%m-%dT%H:%M:%SZ').timestamp()
+
+
+# The bodies of a run are archived one by one as they arrive, so the run is
+# replayed at the time of its last body. At an earlier time a new BW page would
+# be paired with the previous xlsx.
+def fetch_times(index):
+    times = sorted(set(entry['time'] for entries in index.values() for entry in entries))
+
+    for fetch_time, next_time in zip(times, times[1:] + [None]):
+        if next_time and _seconds(next_time) - _seconds(fetch_time) <= RUN_WINDOW:
+            continue
+
+        yield fetch_time
+
+
+# Yields (fetch time, payload, error) for every distinct payload. A snapshot
+# whose fetch() fails is reported with its error instead of ending the replay.
+def snapshots(state):
+    index = {}
+    for entry in archive().entries(state.STATE_SHORT):
+        index.setdefault(entry['url'], []).append(entry)
+
+    seen = set()
+    for fetch_time in fetch_times(index):
+        fetcher = ArchiveFetcher(state.STATE_SHORT, fetch_time, index)
+        try:
+            payload = state.fetch(fetcher)
+        except Exception as e:
+            yield fetch_time, None, str(e)
+            continue
+
+        # A change on a page that does not end up in the payload (e.g. a new
+        # search result pointing to the same article) yields the same payload.
+        key = tuple(fetcher.hashes)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        yield fetch_time, payload, None
+
+
+def _parse(name, fetch_time, payload):
+    try:
+        dt, data = parse_state(name, payload)
+    except Exception as e:
+        return fetch_time, None, [], str(e)
+
+    return fetch_time, dt, data, None
+
+
+# Re-parses every archived snapshot of the given states on a process pool and
+# writes the points in large batches. Points are keyed by measurement, tags and
+# time, so replaying on top of existing data overwrites it in place. The
+# derived fields are rebuilt in fetch time order.
+def replay(states, db_client, dry_run=False):
+    results = []
+    series = ReplaySeries()
+    points = []
+
+    def finish(state, future, failed):
+        nonlocal points
+
+        fetch_time, dt, data, error = future.result() if future else failed
+        if not error:
+            # A strict batch raises for a county without population.
+            try:
+                derived, histories = data.derived(series)
+                data_points = data.points(derived)
+            except Exception as e:
+                dt, data, error = None, [], str(e)
+            else:
+                series.update(histories)
+                points.extend(data_points)
+
+        if error:
+            print('{} {}: {}'.format(state.STATE_SHORT, fetch_time, error))
+
+        results.append((state, fetch_time, dt, len(data)))
+
+        if len(points) >= BATCH_SIZE:
+            if not dry_run:
+                store(db_client, points, batch_size=BATCH_SIZE)
+            points = []
+
+    with create_parse_pool(parse_workers()) as parse_pool:
+        pending = deque()
+        for state in states:
+            for fetch_time, payload, error in snapshots(state):
+                if error:
+                    pending.append((state, None, (fetch_time, None, [], error)))
+                else:
+                    pending.append((state, parse_pool.submit(_parse, state.__name__, fetch_time, payload), None))
+
+                while len(pending) > MAX_PENDING:
+                    finish(*pending.popleft())
+
+        while pending:
+            finish(*pending.popleft())
+
+    if points and not dry_run:
+        store(db_client, points, batch_size=BATCH_SIZE)
+
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+
+    dry_run = '--dry-run' in args
+    state_names = [arg for arg in args if arg != '--dry-run'] or STATES
+    states = [importlib.import_module(name) for name in state_names]
+
+    if dry_run:
+        db_client = None
+    else:
+        db_client = create_db_client()
+
+    start = time.monotonic()
+    try:
+        results = replay(states, db_client, dry_run)
+    finally:
+        if db_client:
+            db_client.close()
+
+    for state in states:
+        state_results = [result for result in results if result[0] is state]
+        parsed = [result for result in state_results if result[2]]
+
+        print('{}: {} snapshots, {} parsed, {} points'.format(
+            state.STATE_SHORT,
+            len(state_results),
+            len(parsed),
+            sum(result[3] for result in state_results)
+        ))
+
+    print('Done in {:.2f}s.'.format(time.monotonic() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import importlib
+import sys
+import time
+from collect import STATES, collect_state, max_workers, parse_workers, warn_missing_population
+from common import JsonStore, cache_path, config, create_db_client, create_parse_pool
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+SCHEDULE_PATH = cache_path('schedule.json')
+
+# All intervals and times of day are in minutes.
+SCHEDULER_CONFIG = config().get('scheduler', {})
+DENSE_INTERVAL = SCHEDULER_CONFIG.get('dense_interval', 5)
+SPARSE_INTERVAL = SCHEDULER_CONFIG.get('sparse_interval', 30)
+IDLE_INTERVAL = SCHEDULER_CONFIG.get('idle_interval', 180)
+WINDOW_MARGIN = SCHEDULER_CONFIG.get('window_margin', 30)
+
+DEFAULT_WINDOW = (8 * 60, 18 * 60)
+HISTORY_SIZE = 28
+MIN_HISTORY = 3
+
+
+def _minute_of_day(dt):
+    return dt.hour * 60 + dt.minute
+
+
+def _format_minute(minute):
+    return '{:02d}:{:02d}'.format(minute // 60, minute % 60)
+
+
+class Schedule(JsonStore):
+    def entry(self, state_short):
+        return self.data.get(state_short, {'last_dt': None, 'last_update': None, 'publications': []})
+
+    # Records the dt returned by a successful run. Only a changed dt counts as a
+    # publication; the time we noticed it is what the window is learned from.
+    def record(self, state_short, dt, now):
+        with self.lock:
+            entry = self.entry(state_short)
+            if entry['last_dt'] == dt:
+                return
+
+            today = now.strftime('%Y-%m-%d')
+            if entry['last_dt'] is not None:
+                entry['publications'] = (entry['publications'] + [_minute_of_day(now)])[-HISTORY_SIZE:]
+                entry['last_update'] = today
+            elif dt.startswith(today):
+                entry['last_update'] = today
+
+            entry['last_dt'] = dt
+
+            self.data[state_short] = entry
+            self.save()
+
+    def window(self, state_short):
+        publications = sorted(self.entry(state_short)['publications'])
+        if len(publications) < MIN_HISTORY:
+            return DEFAULT_WINDOW
+
+        start = publications[len(publications) // 10]
+        end = publications[len(publications) * 9 // 10]
+
+        return max(0, start - WINDOW_MARGIN), min(24 * 60 - 1, end + WINDOW_MARGIN)
+
+    def next_poll(self, state_short, now):
+        start, end = self.window(state_short)
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        if self.entry(state_short)['last_update'] == now.strftime('%Y-%m-%d'):
+            return min(now + timedelta(minutes=IDLE_INTERVAL), midnight + timedelta(days=1, minutes=start))
+
+        minute = _minute_of_day(now)
+        if minute < start:
+            return midnight + timedelta(minutes=start)
+        if minute <= end:
+            return now + timedelta(minutes=DENSE_INTERVAL)
+
+        return now + timedelta(minutes=SPARSE_INTERVAL)
+
+
+SCHEDULE = Schedule(SCHEDULE_PATH)
+
+
+def show(states):
+    now = datetime.now()
+
+    for state in states:
+        entry = SCHEDULE.entry(state.STATE_SHORT)
+        start, end = SCHEDULE.window(state.STATE_SHORT)
+
+        print('{}: window {}-{} ({} publications), last dt {}, last update {}, next poll {}'.format(
+            state.STATE_SHORT,
+            _format_minute(start),
+            _format_minute(end),
+            len(entry['publications']),
+            entry['last_dt'],
+            entry['last_update'],
+            SCHEDULE.next_poll(state.STATE_SHORT, now).strftime('%Y-%m-%d %H:%M')
+        ))
+
+
+def run(states):
+    warn_missing_population(states)
+
+    next_polls = {state: datetime.now() for state in states}
+
+    db_client = create_db_client()
+
+    try:
+        with create_parse_pool(parse_workers()) as parse_pool, ThreadPoolExecutor(max_workers=max_workers()) as executor:
+            while True:
+                now = datetime.now()
+                due = [state for state in states if next_polls[state] <= now]
+                futures = [(state, executor.submit(collect_state, state, db_client, parse_pool)) for state in due]
+
+                for state, future in futures:
+                    status, dt, elapsed = future.result()
+
+                    now = datetime.now()
+                    if dt:
+                        SCHEDULE.record(state.STATE_SHORT, dt, now)
+                    next_polls[state] = SCHEDULE.next_poll(state.STATE_SHORT, now)
+
+                    print('{} {}: {} ({:.2f}s), next poll {}'.format(
+                        now.strftime('%Y-%m-%d %H:%M:%S'),
+                        state.STATE_SHORT,
+                        status,
+                        elapsed,
+                        next_polls[state].strftime('%Y-%m-%d %H:%M')
+                    ), flush=True)
+
+                wait = (min(next_polls.values()) - datetime.now()).total_seconds()
+                if wait > 0:
+                    time.sleep(wait)
+    finally:
+        db_client.close()
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == 'show':
+        args = args[1:]
+
+        show([importlib.import_module(name) for name in args or STATES])
+    else:
+        run([importlib.import_module(name) for name in args or STATES])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,13 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import locale
-import os
-import requests
+import common
+import dates
+import re
 import sys
-import traceback
-from datetime import datetime
+from common import FetchError
 from lxml import html
+from observations import Batch
+from table import Column, Table, own_text
 
 
 DEBUG = False
@@ -17,181 +15,67 @@ DEBUG = False
 STATE = 'Schleswig-Holstein'
 STATE_SHORT = 'SH'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
+XPATHS = common.compile_xpaths({
+    'dt': '//table[@class="covid19 kreistabelle"]/parent::div/p/text()',
+    'rows': '//table[@class="covid19 kreistabelle"]/tbody/tr',
+    'cells': 'td'
+})
 
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
-
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+TABLE = Table(
+    cells=XPATHS['cells'],
+    length=5,
+    county=Column(0, text=own_text),
+    infected=Column(1, text=own_text),
+    death=Column(3, text=own_text),
+    skip=re.compile('SUMME$')
+)
 
 
 def notify(msg):
-    print(msg)
-
-    if 'pushover' not in CONFIG:
-        return
-
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    common.notify(STATE_SHORT, msg)
 
 
 class CoronaParser:
-    def __init__(self, db, tree):
-        self.db = db
+    def __init__(self, tree):
         self.tree = tree
 
-        locale.setlocale(locale.LC_TIME, "de_DE.utf8")
+    def _normalize_county(self, county):
+        return county
+
+    def parse(self):
+        dt_text = XPATHS['dt'](self.tree)[0].strip()
+        dt = dates.strptime(dt_text, 'Datenstand: %d.%m.%Y %H:%M:%S.').strftime('%Y-%m-%dT%H:%M:%SZ')
 
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
+        table = XPATHS['rows'](self.tree)
 
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
+        # Counties
+        data = Batch(STATE, STATE_SHORT, dt)
+        for row in TABLE.extract(table):
+            data.add(self._normalize_county(row.county), row.infected, row.death)
 
-    def _normalize_county(self, county):
-        return county
+        return dt, data
 
-    def _calculate_per_population(self, county, infected, per_population):
-        try:
-            if county in POPULATION['county'][STATE_SHORT]:
-                population = POPULATION['county'][STATE_SHORT][county]
-            else:
-                population = POPULATION['city'][STATE_SHORT][county]
 
-            return round(infected * per_population / population, 2)
-        except:
-            notify('{} not found in population database.'.format(county))
+DATA_URL = 'https://www.schleswig-holstein.de/DE/Schwerpunkte/Coronavirus/Zahlen/zahlen_node.html'
 
-        return None
 
-    def _calculate_p10k(self, county, infected):
-        return self._calculate_per_population(county, infected, 10000)
+def fetch(fetcher, data_url=DATA_URL):
+    r = fetcher.get(data_url)
+    if not r.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
 
-    def _calculate_p100k(self, county, infected):
-        return self._calculate_per_population(county, infected, 100000)
+    return r.text
 
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
 
-        return round(infected * per_population / population, 2)
+def parse(html_text):
+    corona_parser = CoronaParser(html.fromstring(html_text))
 
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
+    return corona_parser.parse()
 
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
 
-    def parse(self):
-        dt_text = self.tree.xpath('//table[@class="covid19 kreistabelle"]/parent::div/p/text()')[0].strip()
-        dt = datetime.strptime(dt_text, 'Datenstand: %d.%m.%Y %H:%M:%S.').strftime('%Y-%m-%dT%H:%M:%SZ')
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
 
-        table = self.tree.xpath('//table[@class="covid19 kreistabelle"]/tbody/tr')
 
-        # Counties
-        data = []
-        infected_sum = 0
-        death_sum = 0
-        for row in table:
-            cells = row.xpath('td')
-
-            if not cells:
-                continue
-
-            if len(cells) != 5:
-                raise Exception('ERROR: invalid cells length: {}'.format(len(cells)))
-
-            if cells[0].text.strip() == 'SUMME':
-                continue
-
-            county = self._normalize_county(cells[0].text.strip())
-            infected_str = cells[1].text.strip()
-            death_str = cells[3].text.strip()
-
-            infected = int(infected_str)
-            infected_sum += infected
-
-            death = int(death_str)
-            death_sum += death
-
-            data.append({
-                'measurement': 'infected_de_state',
-                'tags': {
-                    'state': STATE,
-                    'county': county
-                },
-                'time': dt,
-                'fields': {
-                    'count': infected,
-                    'p10k': self._calculate_p10k(county, infected),
-                    'p100k': self._calculate_p100k(county, infected),
-                    'death': death
-                }
-            })
-
-        data.append({
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum),
-                'death': death_sum
-            }
-        })
-
-        self._store(data)
-
-        return dt
-
-
-data_url = 'https://www.schleswig-holstein.de/DE/Schwerpunkte/Coronavirus/Zahlen/zahlen_node.html'
-if len(sys.argv) == 2:
-    data_url = sys.argv[1]
-
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to fetch data, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, html.fromstring(r.text))
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
@@ -1,16 +1,14 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import locale
-import os
+import common
+import counties
+import dates
 import re
-import requests
 import sys
-import traceback
-from datetime import datetime
+from common import FetchError
 from lxml import html
+from observations import Batch
+from table import Column, Table
 
 
 DEBUG = False
@@ -18,200 +16,78 @@ DEBUG = False
 STATE = 'Sachsen'
 STATE_SHORT = 'SN'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
-
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
-
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+XPATHS = common.compile_xpaths({
+    'dt': '//div[@class="text-col"]/p/text()',
+    'table': '//table',
+    'header': 'thead/tr/th/text()',
+    'rows': 'tbody/tr',
+    'cells': 'td',
+    'cell_text': 'descendant-or-self::*/text()'
+})
+
+TABLE = Table(
+    cells=XPATHS['cells'],
+    length=6,
+    county=Column(0, text=XPATHS['cell_text']),
+    infected=Column(1, text=XPATHS['cell_text']),
+    death=Column(4, text=XPATHS['cell_text'], empty=('',)),
+    header=(XPATHS['header'], 0, 'Kreisfreie Stadt / Landkreis'),
+    skip=re.compile('Gesamtzahl|.*esamt')
+)
 
 
 def notify(msg):
-    print(msg)
-
-    if 'pushover' not in CONFIG:
-        return
-
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    common.notify(STATE_SHORT, msg)
 
 
 class CoronaParser:
-    def __init__(self, db, tree):
-        self.db = db
+    def __init__(self, tree):
         self.tree = tree
 
-        locale.setlocale(locale.LC_TIME, "de_DE.utf8")
-
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
+    def _normalize_county(self, county):
+        return counties.resolve(STATE, county)
 
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
+    def parse(self):
+        dt_array = XPATHS['dt'](self.tree)
+        for dt_text in dt_array:
+            if 'Stand' in dt_text:
+                results = re.findall(r'(Stand:? .+ Uhr)', dt_text)
+                result = results[0].replace('\xa0', ' ')
+                dt = dates.strptime(result, 'Stand %d. %B %Y, %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
+                break
 
-    def _normalize_county(self, county):
-        county = county.replace('Landkreis ', '')
+        table = XPATHS['table'](self.tree)[0]
 
-        if county.startswith('Landeshauptstadt ') or county.startswith('Stadt '):
-            county = county.replace('Landeshauptstadt ', '')
-            county = county.replace('Stadt ', '')
-            county = '{} (Stadt)'.format(county)
+        TABLE.check_header(table)
 
-        return county
+        # Counties
+        data = Batch(STATE, STATE_SHORT, dt)
+        for row in TABLE.extract(XPATHS['rows'](table)):
+            data.add(self._normalize_county(row.county), row.infected, row.death)
 
-    def _calculate_per_population(self, county, infected, per_population):
-        try:
-            if county.endswith('(Stadt)'):
-                raw_county = county.replace(' (Stadt)', '')
-                population = POPULATION['city'][STATE_SHORT][raw_county]
-            else:
-                population = POPULATION['county'][STATE_SHORT][county]
+        return dt, data
 
-            return round(infected * per_population / population, 2)
-        except:
-            notify('{} not found in population database.'.format(county))
 
-        return None
+DATA_URL = 'https://www.coronavirus.sachsen.de/infektionsfaelle-in-sachsen-4151.html'
 
-    def _calculate_p10k(self, county, infected):
-        return self._calculate_per_population(county, infected, 10000)
 
-    def _calculate_p100k(self, county, infected):
-        return self._calculate_per_population(county, infected, 100000)
+def fetch(fetcher, data_url=DATA_URL):
+    r = fetcher.get(data_url)
+    if not r.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
 
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
+    return r.text
 
-        return round(infected * per_population / population, 2)
 
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
+def parse(html_text):
+    corona_parser = CoronaParser(html.fromstring(html_text))
 
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
+    return corona_parser.parse()
 
-    def parse(self):
-        dt_array = self.tree.xpath('//div[@class="text-col"]/p/text()')
-        for dt_text in dt_array:
-            if 'Stand' in dt_text:
-                results = re.findall(r'(Stand:? .+ Uhr)', dt_text)
-                result = results[0].replace('\xa0', ' ')
-                dt = datetime.strptime(result, 'Stand %d. %B %Y, %H:%M Uhr').strftime('%Y-%m-%dT%H:%M:%SZ')
-                break
 
-        table = self.tree.xpath('//table')[0]
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
 
-        if table.xpath('thead/tr/th/text()')[0] != 'Kreisfreie Stadt / Landkreis':
-            raise Exception('ERROR: table not found')
 
-        # Counties
-        data = []
-        infected_sum = 0
-        death_sum = 0
-        for row in table.xpath('tbody/tr'):
-            cells = row.xpath('td')
-            cell0_text = cells[0].xpath('descendant-or-self::*/text()')[0].strip()
-
-            if len(cells) != 6:
-                raise Exception('ERROR: invalid cells length: {}'.format(len(cells)))
-
-            if cell0_text.startswith('Gesamtzahl') or 'esamt' in cell0_text:
-                continue
- 
-            county = self._normalize_county(cells[0].xpath('descendant-or-self::*/text()')[0].strip())
-            infected_str = cells[1].xpath('descendant-or-self::*/text()')[0].replace('.', '').split('(')[0].strip()
-            if not infected_str:
-                infected_str = cells[1].xpath('descendant-or-self::*/text()')[1].replace('.', '').split('(')[0].strip()
-            death_str = cells[4].xpath('descendant-or-self::*/text()')[0].replace('.', '').split('(')[0].strip()
-
-            infected = int(infected_str)
-            infected_sum += infected
-
-            if death_str:
-                death = int(death_str)
-                death_sum += death
-            else:
-                death = 0
-
-            data.append({
-                'measurement': 'infected_de_state',
-                'tags': {
-                    'state': STATE,
-                    'county': county
-                },
-                'time': dt,
-                'fields': {
-                    'count': infected,
-                    'p10k': self._calculate_p10k(county, infected),
-                    'p100k': self._calculate_p100k(county, infected),
-                    'death': death
-                }
-            })
-
-        data.append({
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum),
-                'death': death_sum
-            }
-        })
-
-        self._store(data)
-
-        return dt
-
-
-data_url = 'https://www.coronavirus.sachsen.de/infektionsfaelle-in-sachsen-4151.html'
-if len(sys.argv) == 2:
-    data_url = sys.argv[1]
-
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to fetch data, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, html.fromstring(r.text))
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
@@ -0,0 +1,150 @@
+import collections
+
+
+Row = collections.namedtuple('Row', ['county', 'infected', 'death', 'section'])
+
+
+def clean_text(text):
+    return text.replace('\xa0', ' ').replace('*', '').strip()
+
+
+# Drops footnote markers, bracketed changes like '(+12)' and the thousands
+# separator.
+def clean_number(text):
+    return text.split('(', 1)[0].replace('.', '').replace('\xa0', '').replace('*', '').strip()
+
+
+# Reads the leading text of a cell element without evaluating an XPath.
+def own_text(cell):
+    return [cell.text] if cell.text else []
+
+
+# A column of the county table. If text (an XPath or own_text) is given it is
+# evaluated on the cell, otherwise the cell already is a string. The first
+# non-empty text is used, or all texts joined if join is set. Number values
+# listed in empty count as 0, any other value that is not a number raises.
+# Rows whose cleaned text in this column matches skip are ignored.
+class Column:
+    def __init__(self, index, text=None, join=False, empty=(), skip=None):
+        self.index = index
+        self.text = text
+        self.join = join
+        self.empty = empty
+        self.skip = skip
+
+    def _texts(self, cells):
+        cell = cells[self.index]
+        if self.text is None:
+            return (cell,)
+
+        return self.text(cell)
+
+    def read(self, cells, clean):
+        texts = self._texts(cells)
+        if self.join:
+            return clean(''.join(texts))
+
+        for text in texts:
+            text = clean(text)
+            if text:
+                return text
+
+        return ''
+
+    def number(self, cells):
+        value = ''
+        for text in self._texts(cells):
+            value = clean_number(text)
+            if value:
+                break
+
+        if value in self.empty:
+            return 0
+
+        return int(value)
+
+
+# Declares how a state's county table is read: cells is evaluated once per <tr>,
+# rows with fewer than min_length cells are skipped, and the county is read
+# from the county column or, for tables with a <th> per row, from label.
+# Counties matching stop end the table, those matching sections start a new
+# section (e.g. cities after counties) and those matching skip are ignored,
+# as are rows matching the skip of the infected or death column. All other
+# rows must have length cells. The patterns are compiled regular
+# expressions matched against the start of the cleaned county text.
+class Table:
+    def __init__(self, cells, infected, county=Column(0), death=None, label=None, length=None, min_length=1, header=None, skip=None, stop=None, sections=None):
+        self.cells = cells
+        self.infected = infected
+        self.county = county
+        self.death = death
+        self.label = label
+        self.length = length
+        self.min_length = min_length
+        self.header = header
+        self.skip = skip
+        self.stop = stop
+        self.sections = sections
+        self.skip_columns = [column for column in (infected, death) if column and column.skip]
+
+    # header is (xpath, index, text): the index-th result of xpath on node.
+    def check_header(self, node):
+        xpath, index, text = self.header
+
+        texts = xpath(node)
+        if len(texts) <= index or texts[index] != text:
+            raise Exception('ERROR: table not found')
+
+    def extract(self, rows):
+        cells_xpath = self.cells
+        label = self.label
+        county_column = self.county
+        infected_column = self.infected
+        death_column = self.death
+        length = self.length
+        min_length = self.min_length
+        skip = self.skip
+        stop = self.stop
+        sections = self.sections
+        skip_columns = self.skip_columns
+
+        section = None
+        for row in rows:
+            cells = cells_xpath(row)
+            if len(cells) < min_length:
+                continue
+
+            if label:
+                labels = label(row)
+                if not labels:
+                    continue
+
+                county = clean_text(labels[0])
+            else:
+                county = county_column.read(cells, clean_text)
+
+            if not county:
+                continue
+
+            if stop and stop.match(county):
+                break
+
+            if sections and sections.match(county):
+                section = county
+                continue
+
+            if skip and skip.match(county):
+                continue
+
+            if skip_columns and any(column.skip.match(column.read(cells, clean_text)) for column in skip_columns):
+                continue
+
+            if length and len(cells) != length:
+                raise Exception('ERROR: invalid cells length: {}'.format(len(cells)))
+
+            yield Row(
+                county,
+                infected_column.number(cells),
+                death_column.number(cells) if death_column else None,
+                section
+            )
@@ -1,16 +1,13 @@
 #!/usr/bin/env python3
 
-import influxdb
-import io
-import json
-import locale
-import os
+import common
+import dates
 import re
-import requests
 import sys
-import traceback
-from datetime import datetime
+from common import FetchError
 from lxml import html
+from observations import Batch
+from table import Column, Table, own_text
 
 
 DEBUG = False
@@ -18,95 +15,44 @@ DEBUG = False
 STATE = 'Thüringen'
 STATE_SHORT = 'TH'
 
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-CONFIG_PATH = os.path.join(BASE_PATH, 'config.json')
-POPULATION_PATH = os.path.join(BASE_PATH, 'population.json')
-
-with open(CONFIG_PATH) as file:
-    CONFIG = json.load(file)
-
-with open(POPULATION_PATH, encoding='utf-8') as file:
-    POPULATION = json.load(file)
+XPATHS = common.compile_xpaths({
+    'table': '//table[@class="table table-striped"]',
+    'header': 'thead/tr/th[3]/text()',
+    'dt': 'ancestor::div[@class="frame frame-default frame-type-text frame-layout-0"]/*[self::h2 or self::h3]//text()',
+    'rows': 'tbody/tr',
+    'header_cells': 'th/text()',
+    'cells': 'td'
+})
+
+TABLE = Table(
+    cells=XPATHS['cells'],
+    label=XPATHS['header_cells'],
+    length=8,
+    infected=Column(1, text=own_text, empty=('',)),
+    death=Column(7, text=own_text, empty=('',)),
+    header=(XPATHS['header'], 0, 'aktueller'),
+    skip=re.compile('Summe$')
+)
 
 
 def notify(msg):
-    print(msg)
-
-    if 'pushover' not in CONFIG:
-        return
-
-    requests.post(
-        'https://api.pushover.net/1/messages.json',
-        json={
-            'token': CONFIG['pushover']['token'],
-            'user': CONFIG['pushover']['user'],
-            'title': 'Corona {}: Fehler!'.format(STATE_SHORT),
-            'message': msg
-        }
-    )
+    common.notify(STATE_SHORT, msg)
 
 
 class CoronaParser:
-    def __init__(self, db, tree):
-        self.db = db
+    def __init__(self, tree):
         self.tree = tree
 
-        locale.setlocale(locale.LC_TIME, "de_DE.utf8")
-
-    def _store(self, data):
-        if DEBUG:
-            print(data)
-            return
-
-        try:
-            if not self.db.write_points(data):
-                raise Exception('ERROR: CoronaParser: _store: false')
-        except influxdb.exceptions.InfluxDBServerError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-        except influxdb.exceptions.InfluxDBClientError as e:
-            raise Exception('ERROR: CoronaParser: _store: {}'.format(e))
-
     def _normalize_county(self, county):
         return county
 
-    def _calculate_per_population(self, county, infected, per_population):
-        try:
-            if county in POPULATION['city'][STATE_SHORT]:
-                population = POPULATION['city'][STATE_SHORT][county]
-            else:
-                population = POPULATION['county'][STATE_SHORT][county]
-
-            return round(infected * per_population / population, 2)
-        except:
-            notify('{} not found in population database.'.format(county))
-
-        return None
-
-    def _calculate_p10k(self, county, infected):
-        return self._calculate_per_population(county, infected, 10000)
-
-    def _calculate_p100k(self, county, infected):
-        return self._calculate_per_population(county, infected, 100000)
-
-    def _calculate_state_per_population(self, infected, per_population):
-        population = POPULATION['state'][STATE_SHORT]
-
-        return round(infected * per_population / population, 2)
-
-    def _calculate_state_p10k(self, infected):
-        return self._calculate_state_per_population(infected, 10000)
-
-    def _calculate_state_p100k(self, infected):
-        return self._calculate_state_per_population(infected, 100000)
-
     def parse(self):
-        table = self.tree.xpath('//table[@class="table table-striped"]')[0]
+        table = XPATHS['table'](self.tree)[0]
 
-        if table.xpath('thead/tr/th[3]/text()')[0] != 'aktueller':
-            raise Exception('ERROR: table not found')
+        TABLE.check_header(table)
 
         # Timestamp'
-        dt_array = table.xpath('ancestor::div[@class="frame frame-default frame-type-text frame-layout-0"]/*[self::h2 or self::h3]//text()')
+        dt_array = XPATHS['dt'](table)
         for dt_text in dt_array:
             if 'Stand: ' in dt_text:
                 result = re.findall(r'(\(Stand: .+?\))', dt_text)
@@ -117,105 +63,38 @@ class CoronaParser:
         dt_text = result[0]
 
         try:
-            dt = datetime.strptime(dt_text, '(Stand: %d. %B %Y, %H Uhr)').strftime('%Y-%m-%dT%H:%M:%SZ')
+            dt = dates.strptime(dt_text, '(Stand: %d. %B %Y, %H Uhr)').strftime('%Y-%m-%dT%H:%M:%SZ')
         except ValueError:
-            dt = datetime.strptime(dt_text, '(Stand: %d. %B %Y)').replace(hour=12).strftime('%Y-%m-%dT%H:%M:%SZ')
+            dt = dates.strptime(dt_text, '(Stand: %d. %B %Y)').replace(hour=12).strftime('%Y-%m-%dT%H:%M:%SZ')
 
         # Counties
-        data = []
-        infected_sum = 0
-        death_sum = 0
-        for row in table.xpath('tbody/tr'):
-            thcell = row.xpath('th/text()')
-            cells = row.xpath('td')
-
-            if not thcell or not cells:
-                continue
-
-            if len(cells) != 8:
-                raise Exception('ERROR: invalid cell length: {}'.format(len(cells)))
-
-            if thcell[0].strip() == 'Summe':
-                continue
-
-            county = self._normalize_county(thcell[0].strip())
-            infected_str = cells[1].xpath('text()')[0].strip()
-            death_str = cells[7].xpath('text()')[0].strip()
-
-            if infected_str:
-                infected = int(infected_str)
-                infected_sum += infected
-            else:
-                infected = 0
-
-            if death_str:
-                death = int(death_str)
-                death_sum += death
-            else:
-                death = 0
-
-            data.append({
-                'measurement': 'infected_de_state',
-                'tags': {
-                    'state': STATE,
-                    'county': county
-                },
-                'time': dt,
-                'fields': {
-                    'count': infected,
-                    'p10k': self._calculate_p10k(county, infected),
-                    'p100k': self._calculate_p100k(county, infected),
-                    'death': death
-                }
-            })
-
-        data.append({
-            'measurement': 'infected_de',
-            'tags': {
-                'state': STATE
-            },
-            'time': dt,
-            'fields': {
-                'count': infected_sum,
-                'p10k': self._calculate_state_p10k(infected_sum),
-                'p100k': self._calculate_state_p100k(infected_sum),
-                'death': death_sum
-            }
-        })
-
-        self._store(data)
-
-        return dt
-
-
-data_url = 'https://corona.thueringen.de/bulletin'
-if len(sys.argv) == 2:
-    data_url = sys.argv[1]
-
-r = requests.get(data_url, headers={'User-Agent': CONFIG['user_agent']})
-if not r.ok:
-    print('ERROR: failed to fetch data, status code: {}'.format(r.stats_code))
-    sys.exit(1)
-
-if DEBUG:
-    db_client = None
-else:
-    db_client = influxdb.InfluxDBClient(
-        host=CONFIG['db']['host'],
-        port=CONFIG['db']['port'],
-        username=CONFIG['db']['username'],
-        password=CONFIG['db']['password']
-    )
-    db_client.switch_database(CONFIG['db']['database'])
-
-corona_parser = CoronaParser(db_client, html.fromstring(r.text))
-
-try:
-    dt = corona_parser.parse()
-    print('Data updated at {}'.format(dt))
-except Exception as e:
-    traceback.print_exc()
-    notify(str(e))
-
-if not DEBUG:
-    db_client.close()
+        data = Batch(STATE, STATE_SHORT, dt)
+        for row in TABLE.extract(XPATHS['rows'](table)):
+            data.add(self._normalize_county(row.county), row.infected, row.death)
+
+        return dt, data
+
+
+DATA_URL = 'https://corona.thueringen.de/bulletin'
+
+
+def fetch(fetcher, data_url=DATA_URL):
+    r = fetcher.get(data_url)
+    if not r.ok:
+        raise FetchError('ERROR: failed to fetch data, status code: {}'.format(r.status_code))
+
+    return r.text
+
+
+def parse(html_text):
+    corona_parser = CoronaParser(html.fromstring(html_text))
+
+    return corona_parser.parse()
+
+
+def store(db_client, data):
+    common.store(db_client, data, DEBUG)
+
+
+if __name__ == '__main__':
+    common.main(sys.modules[__name__], sys.argv[1:])
@@ -1,20 +1,45 @@
 #!/usr/bin/env python3
 
+import counties
 import csv
 import json
 import os
+import populations
+import sys
 
 BASE_PATH = os.path.dirname(os.path.realpath(__file__))
 STATES_CSV_PATH = os.path.join(BASE_PATH, 'states.csv')
 COUNTIES_CSV_PATH = os.path.join(BASE_PATH, 'counties.csv')
 CITIES_CSV_PATH = os.path.join(BASE_PATH, 'cities.csv')
 POPULATION_JSON_PATH = os.path.join(BASE_PATH, 'population.json')
+POPULATION_BIN_PATH = os.path.join(BASE_PATH, 'population.bin')
+
+# The store is only rebuilt if the CSVs or the name rules (counties.CITY_NAMES,
+# counties.COMPOSITES) changed, or with --force.
+CHECKSUM = populations.checksum(
+    [STATES_CSV_PATH, COUNTIES_CSV_PATH, CITIES_CSV_PATH],
+    json.dumps([counties.CITY_NAMES, counties.COMPOSITES], sort_keys=True).encode('utf-8')
+)
+if '--force' not in sys.argv[1:] and populations.read_checksum(POPULATION_BIN_PATH) == CHECKSUM:
+    print('population.bin is up to date.')
+    sys.exit(0)
+
+# Rows of the same reference date (Destatis Stichtag) form a version. A version
+# only needs to list what changed, everything else is carried over from the
+# previous one.
+TABLES = {}
+
+
+def table(reference_date):
+    if reference_date not in TABLES:
+        TABLES[reference_date] = {
+            'state': {},
+            'county': {},
+            'city': {}
+        }
+
+    return TABLES[reference_date]
 
-POPULATION = {
-    'state': {},
-    'county': {},
-    'city': {}
-}
 
 with open(STATES_CSV_PATH, encoding='utf-8') as file:
     dict_reader = csv.DictReader(file)
@@ -22,7 +47,7 @@ with open(STATES_CSV_PATH, encoding='utf-8') as file:
         state = row['short']
         population = int(row['population'])
 
-        POPULATION['state'][state] = population
+        table(row['reference_date'])['state'][state] = population
 
 with open(COUNTIES_CSV_PATH, encoding='utf-8') as file:
     dict_reader = csv.DictReader(file)
@@ -31,10 +56,7 @@ with open(COUNTIES_CSV_PATH, encoding='utf-8') as file:
         county = row['county']
         population = int(row['population'])
 
-        if state not in POPULATION['county']:
-            POPULATION['county'][state] = {}
-
-        POPULATION['county'][state][county] = population
+        table(row['reference_date'])['county'].setdefault(state, {})[county] = population
 
 with open(CITIES_CSV_PATH, encoding='utf-8') as file:
     dict_reader = csv.DictReader(file)
@@ -43,11 +65,65 @@ with open(CITIES_CSV_PATH, encoding='utf-8') as file:
         city = row['city']
         population = int(row['population'])
 
-        if state not in POPULATION['city']:
-            POPULATION['city'][state] = {}
+        table(row['reference_date'])['city'].setdefault(state, {})[city] = population
+
+
+def resolve(population, state):
+    resolved = dict(population['county'].get(state, {}))
+
+    for city, city_population in population['city'].get(state, {}).items():
+        if state not in counties.CITY_NAMES:
+            resolved[counties.city_name(state, city)] = city_population
+        elif counties.CITY_NAMES[state] == 'city' or city not in resolved:
+            resolved[city] = city_population
 
-        POPULATION['city'][state][city] = population
+    for region, parts in counties.COMPOSITES.get(state, {}).items():
+        region_population = 0
+        for kind, name in parts:
+            if name not in population[kind].get(state, {}):
+                raise Exception('{} {} of {} not found'.format(kind, name, region))
+            region_population += population[kind][state][name]
 
+        resolved[region] = region_population
+
+    return resolved
+
+
+# Keys as read by common.population(): the state short for the state total,
+# '<state short>/<county>' for the resolved county names.
+VERSIONS = {}
+
+POPULATION = {
+    'state': {},
+    'county': {},
+    'city': {}
+}
+for reference_date in sorted(TABLES):
+    previous = POPULATION
+    POPULATION = {
+        'reference_date': reference_date,
+        'state': dict(previous['state'], **TABLES[reference_date]['state']),
+        'county': {},
+        'city': {},
+        'resolved': {}
+    }
+    for kind in ['county', 'city']:
+        for state in POPULATION['state']:
+            merged = dict(previous[kind].get(state, {}))
+            merged.update(TABLES[reference_date][kind].get(state, {}))
+            if merged:
+                POPULATION[kind][state] = merged
+
+    store = dict(POPULATION['state'])
+    for state in POPULATION['state']:
+        POPULATION['resolved'][state] = resolve(POPULATION, state)
+        for county, population in POPULATION['resolved'][state].items():
+            store['{}/{}'.format(state, county)] = population
+
+    VERSIONS[reference_date] = store
+
+populations.write(POPULATION_BIN_PATH, CHECKSUM, VERSIONS)
+
+# population.json holds the newest version.
 with open(POPULATION_JSON_PATH, 'w', encoding='utf-8') as file:
     json.dump(POPULATION, file, ensure_ascii=False)
-